@@ -3,55 +3,123 @@ Module d'aide pour l'authentification et la gestion des permissions
 Fournit des fonctions utilitaires pour l'authentification des utilisateurs
 """
 
-from pymongo import MongoClient
+import functools
+import hashlib
+import hmac
 import os
+import secrets
+import time
 from dotenv import load_dotenv
-from user_management import UserManager
+from user_management import UserManager, get_client
 
 load_dotenv()
 
-# Configuration MongoDB
-MONGO_HOST = os.getenv('MONGO_HOST', 'localhost')
-MONGO_PORT = int(os.getenv('MONGO_PORT', 27017))
-MONGO_USERNAME = os.getenv('MONGO_USERNAME', 'admin')
-MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
-DATABASE_NAME = 'healthcare_db'
+# Jetons de session : évitent de redemander les identifiants (et de refaire
+# le hachage du mot de passe) dans les traitements par lots
+AUTH_TOKEN_SECRET = os.getenv('AUTH_TOKEN_SECRET', '').encode('utf-8') or secrets.token_bytes(32)
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 3600))
 
-def authenticate_and_get_user():
+# Cache jeton -> (informations utilisateur, expiration), dans l'ordre d'émission ;
+# la durée de vie étant fixe, c'est aussi l'ordre d'expiration
+_TOKEN_CACHE = {}
+
+@functools.lru_cache(maxsize=1)
+def _get_user_manager():
+    """Retourne un UserManager partagé (évite d'ouvrir un MongoClient par appel)"""
+    return UserManager()
+
+def _sign_token(username, expiry):
+    """Calcule la signature HMAC d'un jeton"""
+    return hmac.new(AUTH_TOKEN_SECRET, f"{username}|{expiry}".encode('utf-8'),
+                    hashlib.sha256).hexdigest()
+
+def _purge_expired_tokens(now):
+    """Retire du cache les jetons expirés (les plus anciens sont en tête)"""
+    while _TOKEN_CACHE:
+        token = next(iter(_TOKEN_CACHE))
+        if _TOKEN_CACHE[token][1] >= now:
+            break
+        del _TOKEN_CACHE[token]
+
+def issue_token(user_info):
+    """
+    Émet un jeton de courte durée pour un utilisateur authentifié
+    
+    Args:
+        user_info: Informations de l'utilisateur retournées par authenticate_user
+    
+    Returns:
+        str: Jeton à passer à authenticate_token ou require_permission
+    """
+    now = int(time.time())
+    _purge_expired_tokens(now)
+    expiry = now + AUTH_TOKEN_TTL
+    token = _sign_token(user_info['username'], expiry)
+    _TOKEN_CACHE[token] = (user_info, expiry)
+    return token
+
+def authenticate_token(token):
+    """
+    Retrouve l'utilisateur associé à un jeton valide
+    
+    Returns:
+        dict: Informations de l'utilisateur ou None si le jeton est inconnu ou expiré
+    """
+    entry = _TOKEN_CACHE.get(token)
+    if entry is None:
+        return None
+    
+    user_info, expiry = entry
+    if expiry < time.time() or not hmac.compare_digest(token, _sign_token(user_info['username'], expiry)):
+        _TOKEN_CACHE.pop(token, None)
+        return None
+    return user_info
+
+def authenticate_interactive():
     """
     Demande les identifiants à l'utilisateur et retourne les informations de l'utilisateur
     
+    Un jeton est ajouté sous la clé 'token' pour les appels suivants.
+    
     Returns:
-        dict: Informations de l'utilisateur (username, role, permissions) ou None si échec
+        dict: Informations de l'utilisateur (username, role, permissions, token) ou None si échec
     """
     username = input("Nom d'utilisateur: ")
     password = input("Mot de passe: ")
     
     try:
-        manager = UserManager()
+        manager = _get_user_manager()
         user_info = manager.authenticate_user(username, password)
+        user_info['token'] = issue_token(user_info)
         return user_info
     except Exception as e:
         print(f"✗ Erreur d'authentification: {e}")
         return None
 
+# Nom historique, conservé pour les scripts existants
+authenticate_and_get_user = authenticate_interactive
+
 def require_permission(user_info, permission, action_description=""):
     """
     Vérifie si l'utilisateur a la permission requise
     
     Args:
-        user_info: Dictionnaire avec les informations de l'utilisateur
+        user_info: Dictionnaire avec les informations de l'utilisateur, ou jeton
+            émis par issue_token
         permission: Permission requise (create, read, update, delete, export, import, manage_users)
         action_description: Description de l'action (pour le message d'erreur)
     
     Raises:
         PermissionError: Si l'utilisateur n'a pas la permission
     """
+    if isinstance(user_info, str):
+        user_info = authenticate_token(user_info)
+    
     if not user_info:
         raise PermissionError("Utilisateur non authentifié")
     
-    mgr = UserManager()
-    if not mgr.check_permission(user_info, permission):
+    # Même règle que UserManager.check_permission, sans connexion MongoDB
+    if permission not in user_info.get('permissions', ()):
         action = f" pour {action_description}" if action_description else ""
         raise PermissionError(
             f"Permission refusée: l'utilisateur '{user_info['username']}' "
@@ -65,14 +133,13 @@ def get_authenticated_connection():
     Returns:
         tuple: (MongoClient, user_info) ou (None, None) en cas d'échec
     """
-    user_info = authenticate_and_get_user()
+    user_info = authenticate_interactive()
     if not user_info:
         return None, None
     
     try:
-        # Connexion MongoDB avec les identifiants admin (pour la connexion de base)
-        connection_string = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
-        client = MongoClient(connection_string)
+        # Connexion MongoDB avec les identifiants admin (client partagé du processus)
+        client = get_client()
         
         # Tester la connexion
         client.admin.command('ping')
@@ -5,35 +5,129 @@ Gère l'insertion, la mise à jour et la suppression par lots avec reprise en ca
 
 import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 from datetime import datetime
-from typing import List, Dict, Optional, Callable, Any
+from itertools import chain, islice
+from typing import List, Dict, Iterable, Iterator, Optional, Callable, Any, Tuple
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel, repli sur json de la bibliothèque standard
+    orjson = None
 from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
 from pymongo.errors import BulkWriteError, PyMongoError
 
+# Code d'erreur MongoDB pour une violation d'index unique
+DUPLICATE_KEY_ERROR = 11000
+
+# Modes de sauvegarde de l'état : journal en ajout seul ou fichier JSON remplacé
+STATE_MODES = ('append', 'replace')
+# Nombre de lignes du journal d'état au-delà duquel il est compacté
+STATE_LOG_COMPACT_LINES = 1000
+
+
+def _dumps_state(state: Dict) -> bytes:
+    """Sérialise l'état de reprise (fichier lu uniquement par le programme)"""
+    if orjson is not None:
+        return orjson.dumps(state)
+    return json.dumps(state, ensure_ascii=False).encode('utf-8')
+
+
+def _loads_state(data: bytes) -> Dict:
+    """Désérialise l'état de reprise"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class BatchProcessor:
     """Processeur de lots pour opérations MongoDB"""
     
-    def __init__(self, collection: Collection, batch_size: int = 5000, 
-                 state_file: Optional[str] = None, operation_name: str = "operation"):
+    def __init__(self, collection: Collection, batch_size: Optional[int] = 5000, 
+                 state_file: Optional[str] = None, operation_name: str = "operation",
+                 write_concern: Optional[WriteConcern] = None,
+                 bypass_document_validation: bool = False,
+                 max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 pre_encode: bool = False, checkpoint_every: int = 50,
+                 unique_key: Optional[List[Tuple[str, int]]] = None,
+                 state_mode: str = 'append'):
         """
         Initialise le processeur de lots
         
+        Les écritures sont toujours non ordonnées (ordered=False) : le serveur
+        peut les paralléliser et continue après un document en échec. L'ordre
+        d'insertion au sein d'un lot n'est donc pas garanti.
+        
         Args:
             collection: Collection MongoDB cible
-            batch_size: Taille des lots (défaut: 5000)
+            batch_size: Taille des lots (défaut: 5000). Si None, la taille est
+                calculée par calculate_optimal_batch_size à partir des documents
             state_file: Fichier pour sauvegarder l'état (optionnel)
             operation_name: Nom de l'opération pour les logs
+            write_concern: Write concern appliqué aux lots, par exemple
+                WriteConcern(w=1, j=False) pour des lots non critiques (optionnel)
+            bypass_document_validation: Désactive la validation de schéma côté
+                serveur pendant les écritures (défaut: False)
+            max_workers: Nombre de threads d'envoi des lots, borné par
+                max_in_flight (défaut: min(8, nombre de CPU))
+            max_in_flight: Nombre maximal de lots en cours d'envoi
+                (défaut: 2 × max_workers)
+            pre_encode: Encode chaque lot en BSON une seule fois avant l'envoi
+                (réutilisé tel quel en cas de retry). Inutile si les items sont
+                déjà des RawBSONDocument, voir to_raw_documents (défaut: False)
+            checkpoint_every: Sauvegarde l'état de reprise tous les K lots
+                terminés, ainsi qu'à l'arrêt du traitement (défaut: 50)
+            unique_key: Clé identifiant chaque document source, par exemple
+                [('row_key', 1)]. Un index unique partiel (documents ayant ces
+                champs) est créé avant le premier lot : les documents déjà
+                présents (reprise, retry) sont alors ignorés au lieu d'être
+                dupliqués (optionnel)
+            state_mode: 'append' ajoute une ligne par sauvegarde à un journal
+                (batch_state_*.log), compacté tous les STATE_LOG_COMPACT_LINES
+                lignes ; 'replace' réécrit un fichier JSON (batch_state_*.json)
+                (défaut: 'append')
         """
+        if state_mode not in STATE_MODES:
+            raise ValueError(f"state_mode doit être l'un de {STATE_MODES}: {state_mode!r}")
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
         self.collection = collection
+        self.bypass_document_validation = bypass_document_validation
         self.batch_size = batch_size
-        self.state_file = state_file or f"batch_state_{operation_name}.json"
+        self.state_mode = state_mode
+        extension = 'log' if state_mode == 'append' else 'json'
+        self.state_file = state_file or f"batch_state_{operation_name}.{extension}"
         self.operation_name = operation_name
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        # Un thread au-delà du nombre de lots en vol resterait inactif
+        self.max_workers = min(self.max_workers, self.max_in_flight)
+        self.pre_encode = pre_encode
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.unique_key = unique_key
+        self._stats_lock = threading.Lock()
+        
+        # Écriture asynchrone de l'état : un seul état en attente (les plus
+        # anciens sont remplacés, seul le dernier compte pour la reprise)
+        self._state_queue = queue.Queue(maxsize=1)
+        self._state_writer = None
+        # Descripteur du journal d'état (O_APPEND) et nombre de lignes écrites
+        self._state_fd = None
+        self._state_log_lines = 0
         
         # Statistiques
         self.stats = {
             'total_items': 0,
             'processed_items': 0,
+            'inserted_items': 0,
+            'duplicate_items': 0,
             'successful_batches': 0,
             'failed_batches': 0,
             'retried_batches': 0,
@@ -41,43 +135,135 @@ class BatchProcessor:
             'end_time': None,
             'batches': []
         }
+        # Horloge monotone pour le calcul de la durée (start/end_time: affichage)
+        self._start_ns = None
+        self._end_ns = None
         
         # État pour reprise
         self.state = {
             'last_processed_index': 0,
             'total_batches': 0,
             'current_batch': 0,
+            'completed_batches': [],
+            'batch_size': None,
             'operation': operation_name,
             'timestamp': None
         }
     
-    def _save_state(self, last_index: int, current_batch: int, total_batches: int):
-        """Sauvegarde l'état actuel pour permettre la reprise"""
+    def _save_state(self, last_index: int, current_batch: int, total_batches: int,
+                    timestamp: Optional[str] = None, completed_batches: Iterable[int] = ()):
+        """Sauvegarde l'état actuel pour permettre la reprise (en arrière-plan)"""
         self.state['last_processed_index'] = last_index
         self.state['current_batch'] = current_batch
         self.state['total_batches'] = total_batches
-        self.state['timestamp'] = datetime.now().isoformat()
+        self.state['completed_batches'] = sorted(completed_batches)
+        self.state['batch_size'] = self.batch_size
+        self.state['timestamp'] = timestamp or datetime.now().isoformat()
         
+        if self._state_writer is None:
+            self._state_writer = threading.Thread(target=self._state_writer_loop, daemon=True)
+            self._state_writer.start()
+        
+        state = dict(self.state)
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, indent=2, ensure_ascii=False)
+            self._state_queue.put_nowait(state)
+        except queue.Full:
+            # Remplacer l'état encore en attente par le plus récent
+            try:
+                self._state_queue.get_nowait()
+                self._state_queue.task_done()
+            except queue.Empty:
+                pass
+            self._state_queue.put_nowait(state)
+    
+    def _state_writer_loop(self):
+        """Boucle du thread d'écriture de l'état (None pour l'arrêter)"""
+        while True:
+            state = self._state_queue.get()
+            try:
+                if state is None:
+                    return
+                self._write_state(state)
+            finally:
+                self._state_queue.task_done()
+    
+    def _write_state(self, state: Dict):
+        """Écrit l'état selon state_mode (thread d'écriture uniquement)"""
+        try:
+            if self.state_mode == 'append':
+                self._append_state(state)
+            else:
+                self._replace_state(state)
         except Exception as e:
             print(f"⚠ Avertissement: Impossible de sauvegarder l'état: {e}")
     
+    def _append_state(self, state: Dict):
+        """Ajoute l'état en fin de journal (une ligne JSON par sauvegarde)"""
+        if self._state_log_lines >= STATE_LOG_COMPACT_LINES:
+            # Compactage : le journal est remplacé par sa dernière ligne
+            self._close_state_log()
+            self._replace_state(state, suffix=b'\n')
+            self._state_log_lines = 1
+            return
+        if self._state_fd is None:
+            self._state_fd = os.open(self.state_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self._state_fd, _dumps_state(state) + b'\n')
+        self._state_log_lines += 1
+    
+    def _replace_state(self, state: Dict, suffix: bytes = b''):
+        """Écrit l'état de façon atomique (fichier temporaire puis renommage)"""
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(_dumps_state(state) + suffix)
+        os.replace(tmp_file, self.state_file)
+    
+    def _close_state_log(self):
+        """Ferme le descripteur du journal d'état"""
+        if self._state_fd is not None:
+            os.close(self._state_fd)
+            self._state_fd = None
+    
+    def _stop_state_writer(self):
+        """Attend l'écriture du dernier état puis arrête le thread d'écriture"""
+        if self._state_writer is None:
+            return
+        self._state_queue.put(None)
+        self._state_writer.join()
+        self._state_writer = None
+        self._close_state_log()
+        self._state_log_lines = 0
+    
     def _load_state(self) -> Optional[Dict]:
         """Charge l'état sauvegardé pour reprendre"""
         if not os.path.exists(self.state_file):
             return None
         
         try:
-            with open(self.state_file, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-                print(f"✓ État de reprise trouvé: {state['current_batch']}/{state['total_batches']} lots traités")
+            with open(self.state_file, 'rb') as f:
+                if self.state_mode == 'append':
+                    state = self._last_logged_state(f)
+                    if state is None:
+                        return None
+                else:
+                    state = _loads_state(f.read())
+                total = state['total_batches'] if state['total_batches'] is not None else '?'
+                print(f"✓ État de reprise trouvé: {state['current_batch']}/{total} lots traités")
                 return state
         except Exception as e:
             print(f"⚠ Avertissement: Impossible de charger l'état: {e}")
             return None
     
+    @staticmethod
+    def _last_logged_state(f) -> Optional[Dict]:
+        """Renvoie le dernier état valide du journal (lignes tronquées ignorées)"""
+        state = None
+        for line in f:
+            try:
+                state = _loads_state(line)
+            except ValueError:
+                continue
+        return state
+    
     def _clear_state(self):
         """Supprime le fichier d'état"""
         if os.path.exists(self.state_file):
@@ -99,10 +285,17 @@ class BatchProcessor:
             True si succès, False sinon
         """
         try:
-            result = self.collection.insert_many(batch, ordered=False)
+            result = self.collection.insert_many(
+                batch,
+                ordered=False,
+                bypass_document_validation=self.bypass_document_validation
+            )
             
+            with self._stats_lock:
+                self.stats['inserted_items'] += len(result.inserted_ids)
+                if retry:
+                    self.stats['retried_batches'] += 1
             if retry:
-                self.stats['retried_batches'] += 1
                 print(f"  ✓ Retry réussi pour le lot {batch_number}")
             
             return True
@@ -110,12 +303,25 @@ class BatchProcessor:
         except BulkWriteError as e:
             # Certains documents peuvent avoir échoué, mais d'autres ont réussi
             inserted = e.details.get('nInserted', 0)
-            if inserted > 0:
-                print(f"  ⚠ Lot {batch_number}: {inserted}/{len(batch)} documents insérés (certains ont échoué)")
-                return True
-            else:
-                print(f"  ✗ Lot {batch_number}: Échec complet de l'insertion")
+            write_errors = e.details.get('writeErrors', [])
+            duplicates = sum(1 for error in write_errors
+                             if error.get('code') == DUPLICATE_KEY_ERROR)
+            with self._stats_lock:
+                self.stats['inserted_items'] += inserted
+                self.stats['duplicate_items'] += duplicates
+            if e.details.get('writeConcernErrors') or duplicates < len(write_errors):
+                # Écritures non confirmées ou documents en échec : le lot est
+                # retenté en entier (les documents déjà insérés gardent leur
+                # _id et sont ignorés comme doublons au retry)
+                print(f"  ✗ Lot {batch_number}: {inserted}/{len(batch)} documents insérés, "
+                      f"{len(write_errors) - duplicates} en échec")
                 return False
+            if write_errors:
+                # Documents déjà présents (reprise ou retry) : le lot est complet
+                print(f"  ✓ Lot {batch_number}: {inserted} insérés, {duplicates} déjà présents ignorés")
+                return True
+            print(f"  ✗ Lot {batch_number}: Échec complet de l'insertion")
+            return False
                 
         except PyMongoError as e:
             print(f"  ✗ Lot {batch_number}: Erreur MongoDB: {e}")
@@ -124,89 +330,211 @@ class BatchProcessor:
             print(f"  ✗ Lot {batch_number}: Erreur inattendue: {e}")
             return False
     
-    def process_batches(self, items: List[Dict], operation: str = 'insert', 
-                       resume: bool = True, validate_callback: Optional[Callable] = None) -> Dict:
+    def _ensure_unique_index(self):
+        """Crée l'index unique sur unique_key (sans effet s'il existe déjà)"""
+        if self.unique_key:
+            # Index partiel : les documents existants sans la clé (écrits
+            # avant son introduction) n'empêchent pas sa création
+            self.collection.create_index(
+                self.unique_key, unique=True,
+                partialFilterExpression={field: {'$exists': True} for field, _ in self.unique_key}
+            )
+    
+    def _run_batch(self, batch: List[Dict], batch_number: int, operation: str) -> bool:
+        """
+        Exécute un lot avec une tentative de retry (appelé depuis les threads d'envoi)
+        
+        Args:
+            batch: Liste d'items du lot
+            batch_number: Numéro du lot
+            operation: Type d'opération ('insert', 'update', 'delete')
+            
+        Returns:
+            True si succès, False sinon
+        """
+        if operation != 'insert':
+            print(f"  ✗ Opération '{operation}' non supportée")
+            return False
+        
+        if self.pre_encode:
+            batch = list(to_raw_documents(batch))
+        
+        if self._insert_batch(batch, batch_number):
+            return True
+        
+        print(f"  🔄 Tentative de retry pour le lot {batch_number}...")
+        return self._insert_batch(batch, batch_number, retry=True)
+    
+    def process_batches(self, items: Iterable[Dict], operation: str = 'insert', 
+                       resume: bool = True, validate_callback: Optional[Callable] = None,
+                       total_items: Optional[int] = None) -> Dict:
         """
         Traite les items par lots
         
+        Les lots sont envoyés en parallèle par un pool de threads borné
+        (max_in_flight lots en cours au maximum). L'état de reprise contient
+        l'index atteint par les lots terminés de façon contiguë depuis le
+        début, ainsi que les numéros des lots terminés au-delà de ce point :
+        à la reprise, ces derniers sont sautés au lieu d'être renvoyés.
+        
+        Les items sont consommés au fil de l'eau : un générateur (lecture CSV
+        par morceaux, curseur...) permet un traitement à mémoire constante.
+        
         Args:
-            items: Liste d'items à traiter
+            items: Items à traiter (liste ou itérable quelconque)
             operation: Type d'opération ('insert', 'update', 'delete')
             resume: Si True, reprend depuis le dernier état sauvegardé
             validate_callback: Fonction de validation optionnelle (appelée à la fin)
+            total_items: Nombre total d'items, si items n'a pas de longueur (optionnel)
             
         Returns:
             Dictionnaire avec les statistiques de traitement
         """
         self.stats['start_time'] = datetime.now()
-        self.stats['total_items'] = len(items)
+        self._start_ns = time.monotonic_ns()
+        if total_items is None and hasattr(items, '__len__'):
+            total_items = len(items)
+        self.stats['total_items'] = total_items
+        
+        iterator = iter(items)
+        if self.batch_size is None:
+            # Échantillon des premiers items, remis en tête de l'itérateur
+            sample = list(islice(iterator, BATCH_SIZE_SAMPLE))
+            iterator = chain(sample, iterator)
+            self.batch_size = calculate_optimal_batch_size(total_items, items=sample)
+        
+        # L'index unique doit exister avant le premier lot pour dédupliquer
+        self._ensure_unique_index()
         
         # Charger l'état si reprise demandée
         start_index = 0
-        if resume:
-            saved_state = self._load_state()
-            if saved_state:
-                start_index = saved_state['last_processed_index']
-                print(f"🔄 Reprise depuis l'index {start_index}")
-        
-        # Calculer le nombre total de lots
-        total_batches = (len(items) - start_index + self.batch_size - 1) // self.batch_size
+        skip_batches = set()
+        saved_state = self._load_state() if resume else None
+        if saved_state:
+            start_index = saved_state['last_processed_index']
+            # Les numéros de lots ne valent que pour la même taille de lot
+            if saved_state.get('batch_size') == self.batch_size:
+                skip_batches = set(saved_state.get('completed_batches', []))
+            print(f"🔄 Reprise depuis l'index {start_index}")
+        else:
+            # Nouveau départ : l'état d'une exécution précédente ne doit pas
+            # se mêler au journal de celle-ci
+            self._clear_state()
+        
+        # Sauter les items déjà traités en avançant l'itérateur lui-même (sans
+        # copie ni couche islice supplémentaire pour les items suivants)
+        if start_index > 0:
+            next(islice(iterator, start_index, start_index), None)
+        
+        # Calculer le nombre total de lots (inconnu si le total n'est pas fourni)
+        total_batches = None
+        if total_items is not None:
+            total_batches = (total_items - start_index + self.batch_size - 1) // self.batch_size
+        total_label = total_batches if total_batches is not None else '?'
         current_batch = (start_index // self.batch_size) + 1
         
         print(f"\n=== Traitement par lots ({self.operation_name}) ===")
-        print(f"Total d'items: {len(items)}")
+        print(f"Total d'items: {total_items if total_items is not None else '?'}")
         print(f"Taille des lots: {self.batch_size}")
-        print(f"Nombre de lots: {total_batches}")
+        print(f"Nombre de lots: {total_label}")
+        print(f"Threads d'envoi: {self.max_workers} ({self.max_in_flight} lots en vol max)")
         if start_index > 0:
             print(f"Reprise depuis: {start_index} items ({current_batch-1} lots déjà traités)")
         print()
         
-        # Traiter par lots
-        for i in range(start_index, len(items), self.batch_size):
-            batch = items[i:i + self.batch_size]
-            batch_number = (i // self.batch_size) + 1
-            
-            print(f"[{batch_number}/{total_batches}] Traitement du lot {batch_number} ({len(batch)} items)...", end=' ')
-            
-            # Sélectionner la méthode selon l'opération
-            if operation == 'insert':
-                success = self._insert_batch(batch, batch_number)
-            else:
-                print(f"✗ Opération '{operation}' non supportée")
-                success = False
-            
-            # Retry en cas d'échec
-            if not success:
-                print(f"\n  🔄 Tentative de retry pour le lot {batch_number}...", end=' ')
-                
-                if operation == 'insert':
-                    retry_success = self._insert_batch(batch, batch_number, retry=True)
+        in_flight = {}          # future -> (index de début, numéro de lot, taille)
+        completed = {}          # numéro de lot -> index de fin, en attente de contiguïté
+        next_batch = current_batch
+        last_index = start_index
+        saved_batch = current_batch - 1
+        failed = False
+        
+        def checkpoint(timestamp=None):
+            """Sauvegarde l'état : dernier lot contigu et lots terminés au-delà"""
+            nonlocal saved_batch
+            saved_batch = next_batch - 1
+            self._save_state(last_index, saved_batch, total_batches, timestamp,
+                             completed_batches=completed)
+        
+        def advance():
+            """Avance le point de reprise contigu sur les lots terminés"""
+            nonlocal next_batch, last_index
+            while next_batch in completed:
+                last_index = completed.pop(next_batch)
+                next_batch += 1
+        
+        def collect(return_when):
+            """Récupère les lots terminés et avance le point de reprise contigu"""
+            nonlocal failed
+            done, _ = wait(in_flight, return_when=return_when)
+            # Un seul horodatage pour tous les lots récupérés par cet appel
+            now_iso = datetime.now().isoformat()
+            for future in done:
+                start, batch_number, count = in_flight.pop(future)
+                success = future.result()
+                if success:
+                    self.stats['successful_batches'] += 1
+                    self.stats['processed_items'] += count
+                    completed[batch_number] = start + count
+                    print(f"[{batch_number}/{total_label}] ✓ Lot {batch_number} traité ({count} items)")
                 else:
-                    retry_success = False
-                
-                if not retry_success:
+                    self.stats['failed_batches'] += 1
+                    failed = True
                     print(f"\n✗ Échec après retry pour le lot {batch_number}. Arrêt du traitement.")
-                    self._save_state(i, batch_number, total_batches)
-                    self.stats['end_time'] = datetime.now()
-                    return self.stats
-            
-            if success or (not success and retry_success):
-                self.stats['successful_batches'] += 1
-                self.stats['processed_items'] += len(batch)
-            else:
-                self.stats['failed_batches'] += 1
-            
-            # Sauvegarder l'état après chaque lot
-            self._save_state(i + len(batch), batch_number, total_batches)
+                
+                # Enregistrer les stats du lot
+                self.stats['batches'].append({
+                    'batch_number': batch_number,
+                    'items_count': count,
+                    'success': success,
+                    'timestamp': now_iso
+                })
             
-            # Enregistrer les stats du lot
-            batch_stats = {
-                'batch_number': batch_number,
-                'items_count': len(batch),
-                'success': success or retry_success,
-                'timestamp': datetime.now().isoformat()
-            }
-            self.stats['batches'].append(batch_stats)
+            advance()
+            if next_batch - 1 - saved_batch >= self.checkpoint_every:
+                checkpoint(now_iso)
+        
+        # Traiter par lots
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                i = start_index
+                while True:
+                    if len(in_flight) >= self.max_in_flight:
+                        collect(FIRST_COMPLETED)
+                        if failed:
+                            break
+                    
+                    batch = list(islice(iterator, self.batch_size))
+                    if not batch:
+                        break
+                    batch_number = (i // self.batch_size) + 1
+                    if batch_number in skip_batches:
+                        # Lot terminé lors d'une exécution précédente
+                        completed[batch_number] = i + len(batch)
+                        advance()
+                        print(f"[{batch_number}/{total_label}] ↷ Lot {batch_number} déjà traité, ignoré")
+                        i += len(batch)
+                        continue
+                    future = executor.submit(self._run_batch, batch, batch_number, operation)
+                    in_flight[future] = (i, batch_number, len(batch))
+                    i += len(batch)
+                
+                if in_flight:
+                    collect(ALL_COMPLETED)
+        finally:
+            # Dernier état à l'arrêt (fin, échec ou interruption), écrit sur
+            # disque avant un éventuel nettoyage
+            if next_batch - 1 > saved_batch or completed:
+                checkpoint()
+            self._stop_state_writer()
+        
+        if self.stats['total_items'] is None:
+            self.stats['total_items'] = i
+        
+        if failed:
+            self.stats['end_time'] = datetime.now()
+            self._end_ns = time.monotonic_ns()
+            return self.stats
         
         # Validation finale si callback fourni
         if validate_callback:
@@ -224,6 +552,7 @@ class BatchProcessor:
         self._clear_state()
         
         self.stats['end_time'] = datetime.now()
+        self._end_ns = time.monotonic_ns()
         
         # Afficher les statistiques finales
         self._print_statistics()
@@ -232,7 +561,7 @@ class BatchProcessor:
     
     def _print_statistics(self):
         """Affiche les statistiques de traitement"""
-        duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+        duration = (self._end_ns - self._start_ns) / 1e9
         items_per_second = self.stats['processed_items'] / duration if duration > 0 else 0
         
         print("\n" + "="*60)
@@ -240,6 +569,9 @@ class BatchProcessor:
         print("="*60)
         print(f"Items totaux: {self.stats['total_items']}")
         print(f"Items traités: {self.stats['processed_items']}")
+        print(f"Documents insérés: {self.stats['inserted_items']}")
+        if self.stats['duplicate_items']:
+            print(f"Documents déjà présents ignorés: {self.stats['duplicate_items']}")
         print(f"Lots réussis: {self.stats['successful_batches']}")
         print(f"Lots échoués: {self.stats['failed_batches']}")
         print(f"Lots retry: {self.stats['retried_batches']}")
@@ -257,20 +589,63 @@ class BatchProcessor:
         print("✓ État de reprise supprimé")
 
 
-def calculate_optimal_batch_size(total_items: int, max_batch_size: int = 5000) -> int:
+def to_raw_documents(documents: Iterable[Dict]) -> Iterator[RawBSONDocument]:
+    """
+    Encode les documents en BSON une seule fois (RawBSONDocument)
+    
+    insert_many envoie alors les octets sans reparcourir les dictionnaires.
+    Un _id est attribué avant l'encodage pour qu'un retry reste idempotent.
+    
+    Args:
+        documents: Documents à encoder (liste ou générateur)
+        
+    Yields:
+        Documents encodés
+    """
+    for doc in documents:
+        if isinstance(doc, RawBSONDocument):
+            yield doc
+            continue
+        if '_id' not in doc:
+            doc = {'_id': ObjectId(), **doc}
+        yield RawBSONDocument(bson.encode(doc))
+
+
+# Taille cible d'un lot en octets BSON (limite du protocole MongoDB: 16 MB par message)
+TARGET_BATCH_BYTES = 8 * 1024 * 1024
+# Nombre de documents échantillonnés pour estimer la taille moyenne
+BATCH_SIZE_SAMPLE = 32
+
+
+def calculate_optimal_batch_size(total_items: Optional[int], max_batch_size: int = 5000,
+                                 items: Optional[List[Dict]] = None) -> int:
     """
     Calcule une taille de lot optimale basée sur le nombre total d'items
     
+    Si des documents sont fournis, la taille est aussi bornée pour que chaque
+    lot pèse environ TARGET_BATCH_BYTES, d'après la taille BSON moyenne des
+    premiers documents.
+    
     Args:
-        total_items: Nombre total d'items à traiter
+        total_items: Nombre total d'items à traiter (None si inconnu)
         max_batch_size: Taille maximale de lot
+        items: Documents à traiter, utilisés pour estimer leur taille (optionnel)
         
     Returns:
         Taille de lot optimale
     """
-    if total_items <= 1000:
-        return min(100, total_items)
+    if total_items is None:
+        batch_size = max_batch_size
+    elif total_items <= 1000:
+        batch_size = min(100, total_items)
     elif total_items <= 10000:
-        return min(1000, total_items)
+        batch_size = min(1000, total_items)
     else:
-        return max_batch_size
+        batch_size = max_batch_size
+    
+    if items:
+        sample = items[:BATCH_SIZE_SAMPLE]
+        avg_bytes = sum(len(bson.encode(doc)) for doc in sample) / len(sample)
+        batch_size = min(batch_size, max(100, int(TARGET_BATCH_BYTES // avg_bytes)))
+    
+    return max(batch_size, 1)
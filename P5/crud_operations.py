@@ -5,9 +5,11 @@ Avec authentification utilisateur et gestion des permissions.
 """
 
 from pymongo import MongoClient
+from pymongo.collation import Collation
 from datetime import datetime
 import sys
 import os
+from typing import Dict, Iterable, Optional
 from dotenv import load_dotenv
 from auth_helper import authenticate_and_get_user, require_permission, get_authenticated_connection
 from batch_processor import BatchProcessor
@@ -22,6 +24,12 @@ MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
 DATABASE_NAME = 'healthcare_db'
 COLLECTION_NAME = 'patients'
 
+# Projection des champs affichés par les exemples de lecture
+SUMMARY_PROJECTION = {'name': 1, 'medical_condition': 1, 'age': 1, '_id': 0}
+
+# Collation insensible à la casse (strength=2) de l'index sur le nom
+NAME_COLLATION = Collation(locale='en', strength=2)
+
 def get_connection():
     """Établit la connexion à MongoDB avec authentification"""
     client, user_info = get_authenticated_connection()
@@ -30,14 +38,24 @@ def get_connection():
         sys.exit(1)
     return client, user_info
 
-def create_document(client, user_info):
+def ensure_indexes(collection):
+    """Crée l'index insensible à la casse sur le nom (opération idempotente)"""
+    collection.create_index([('name', 1)], collation=NAME_COLLATION)
+
+# Borne haute des intervalles de préfixe : dans la collation CLDR (ICU) de
+# MongoDB, U+FFFF a le poids primaire maximal et se classe après tout caractère
+# (contrairement à chr(ord(c) + 1) : après 'z' vient '{', classé avant les lettres)
+COLLATION_MAX_CHAR = '\uffff'
+
+def prefix_range(prefix):
+    """Filtre d'intervalle [prefix, prefix + U+FFFF[ utilisable par un index avec NAME_COLLATION"""
+    return {'$gte': prefix, '$lt': prefix + COLLATION_MAX_CHAR}
+
+def create_document(collection, user_info):
     """CREATE - Créer un nouveau document"""
     require_permission(user_info, 'create', 'créer un document')
     print("\n=== CREATE - Création d'un document ===")
     
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
-    
     new_patient = {
         'name': 'Jean Dupont',
         'age': 45,
@@ -61,29 +79,31 @@ def create_document(client, user_info):
     print(f"✓ Document créé avec l'ID: {result.inserted_id}")
     return result.inserted_id
 
-def read_documents(client, user_info):
+def read_documents(collection, user_info):
     """READ - Lire des documents"""
     require_permission(user_info, 'read', 'lire des documents')
     print("\n=== READ - Lecture de documents ===")
     
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
-    
     # Lire tous les documents (limité à 5 pour l'exemple)
     print("\n1. Les 5 premiers patients:")
-    patients = collection.find().limit(5)
+    patients = collection.find({}, projection=SUMMARY_PROJECTION).limit(5)
     for i, patient in enumerate(patients, 1):
         print(f"   {i}. {patient['name']} - {patient['medical_condition']} - {patient['age']} ans")
     
     # Lire avec un filtre
     print("\n2. Patients avec Hypertension:")
-    hypertension_patients = collection.find({'medical_condition': 'Hypertension'}).limit(3)
+    hypertension_patients = collection.find({'medical_condition': 'Hypertension'},
+                                            projection={'name': 1, 'age': 1, '_id': 0}).limit(3)
     for patient in hypertension_patients:
         print(f"   - {patient['name']} ({patient['age']} ans)")
     
     # Lire un document spécifique
     print("\n3. Recherche par nom (exemple):")
-    patient = collection.find_one({'name': {'$regex': 'Jean', '$options': 'i'}})
+    # Préfixe en intervalle + collation de l'index : parcours d'index au lieu
+    # d'un scan complet (une regex insensible à la casse ne peut pas l'utiliser)
+    patient = collection.find_one({'name': prefix_range('Jean')},
+                                  projection=SUMMARY_PROJECTION,
+                                  collation=NAME_COLLATION)
     if patient:
         print(f"   Trouvé: {patient['name']} - {patient['medical_condition']}")
     else:
@@ -93,14 +113,11 @@ def read_documents(client, user_info):
     total = collection.count_documents({})
     print(f"\n4. Nombre total de documents: {total}")
 
-def update_document(client, user_info, document_id):
+def update_document(collection, user_info, document_id):
     """UPDATE - Mettre à jour un document"""
     require_permission(user_info, 'update', 'mettre à jour un document')
     print("\n=== UPDATE - Mise à jour d'un document ===")
     
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
-    
     # Mettre à jour un document spécifique
     if document_id:
         result = collection.update_one(
@@ -121,14 +138,11 @@ def update_document(client, user_info, document_id):
     )
     print(f"✓ {result.modified_count} document(s) modifié(s)")
 
-def delete_document(client, user_info, document_id):
+def delete_document(collection, user_info, document_id):
     """DELETE - Supprimer un document"""
     require_permission(user_info, 'delete', 'supprimer un document')
     print("\n=== DELETE - Suppression d'un document ===")
     
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
-    
     if document_id:
         # Supprimer un document spécifique
         result = collection.delete_one({'_id': document_id})
@@ -139,19 +153,24 @@ def delete_document(client, user_info, document_id):
     # result = collection.delete_many({'age': {'$lt': 18}})
     # print(f"✓ {result.deleted_count} document(s) supprimé(s)")
 
-def batch_create_documents(client, user_info, documents: list, batch_size: int = 5000):
-    """CREATE - Créer plusieurs documents par lots"""
+def batch_create_documents(collection, user_info, documents: Iterable[Dict], batch_size: int = 5000,
+                           total: Optional[int] = None):
+    """
+    CREATE - Créer plusieurs documents par lots
+    
+    documents peut être un générateur (ex: lecture CSV par morceaux) : les lots
+    sont formés au fil de la lecture, sans charger tout le jeu de données.
+    """
     require_permission(user_info, 'create', 'créer des documents')
-    print(f"\n=== CREATE - Création de {len(documents)} documents par lots ===")
-    
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
+    if total is None and hasattr(documents, '__len__'):
+        total = len(documents)
+    print(f"\n=== CREATE - Création de {total if total is not None else '?'} documents par lots ===")
     
     # Créer le processeur de lots
     batch_processor = BatchProcessor(
         collection=collection,
         batch_size=batch_size,
-        state_file="batch_state_crud_create.json",
+        state_file="batch_state_crud_create.log",
         operation_name="crud_create"
     )
     
@@ -159,20 +178,18 @@ def batch_create_documents(client, user_info, documents: list, batch_size: int =
     stats = batch_processor.process_batches(
         items=documents,
         operation='insert',
-        resume=True
+        resume=True,
+        total_items=total
     )
     
     print(f"\n✓ {stats['processed_items']} documents créés avec succès")
     return stats
 
-def demonstrate_queries(client, user_info):
+def demonstrate_queries(collection, user_info):
     """Démontre des requêtes avancées"""
     require_permission(user_info, 'read', 'exécuter des requêtes')
     print("\n=== Requêtes avancées ===")
     
-    db = client[DATABASE_NAME]
-    collection = db[COLLECTION_NAME]
-    
     # Agrégation: compter par condition médicale
     print("\n1. Nombre de patients par condition médicale:")
     pipeline = [
@@ -186,13 +203,15 @@ def demonstrate_queries(client, user_info):
     
     # Recherche avec opérateurs
     print("\n2. Patients de plus de 60 ans:")
-    elderly = collection.find({'age': {'$gt': 60}}).limit(5)
+    elderly = collection.find({'age': {'$gt': 60}},
+                              projection={'name': 1, 'age': 1, '_id': 0}).limit(5)
     for patient in elderly:
         print(f"   - {patient['name']} ({patient['age']} ans)")
     
     # Tri et limite
     print("\n3. Top 3 factures les plus élevées:")
-    top_bills = collection.find().sort('billing_amount', -1).limit(3)
+    top_bills = (collection.find({}, projection={'name': 1, 'billing_amount': 1, '_id': 0})
+                 .sort('billing_amount', -1).limit(3))
     for patient in top_bills:
         print(f"   - {patient['name']}: ${patient['billing_amount']:.2f}")
 
@@ -203,27 +222,29 @@ def main():
     client, user_info = get_connection()
     print(f"✓ Connexion établie pour l'utilisateur: {user_info['username']} (rôle: {user_info['role']})\n")
     
+    # Collection résolue une seule fois pour toutes les opérations
+    collection = client[DATABASE_NAME][COLLECTION_NAME]
+    
     try:
+        ensure_indexes(collection)
+        
         # CREATE
-        document_id = create_document(client, user_info)
+        document_id = create_document(collection, user_info)
         
         # READ
-        read_documents(client, user_info)
+        read_documents(collection, user_info)
         
         # UPDATE
-        update_document(client, user_info, document_id)
+        update_document(collection, user_info, document_id)
         
         # DELETE
-        delete_document(client, user_info, document_id)
+        delete_document(collection, user_info, document_id)
         
         # Requêtes avancées
-        demonstrate_queries(client, user_info)
+        demonstrate_queries(collection, user_info)
         
     except Exception as e:
         print(f"✗ Erreur: {e}")
-    finally:
-        client.close()
-        print("\n✓ Connexion fermée")
 
 if __name__ == "__main__":
     main()
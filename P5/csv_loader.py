@@ -0,0 +1,107 @@
+"""
+Module de lecture du fichier healthcare_dataset.csv
+Lecture par blocs avec le lecteur CSV en flux de pyarrow
+"""
+
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Nombre de lignes par morceau
+DEFAULT_CHUNK_ROWS = 50000
+# Taille des blocs lus par pyarrow (analyse multi-thread à l'intérieur d'un bloc)
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+# Valeurs lues comme manquantes, comme pandas.read_csv par défaut (cellules vides comprises)
+CSV_NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                   '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+                   'n/a', 'nan', 'null']
+# Types essayés, dans l'ordre, pour les colonnes sans type imposé
+INFERRED_TYPES = (pa.int64(), pa.float64())
+# Lignes converties à l'essai avant la colonne entière : une conversion en
+# échec parcourt toute la colonne, l'échantillon écarte vite les colonnes texte
+INFERENCE_SAMPLE_ROWS = 1000
+
+
+def _arrow_type(pandas_type: str) -> pa.DataType:
+    """Type Arrow correspondant à un type pandas ('int16', 'float64', 'str'...)"""
+    if pandas_type in ('str', 'string', 'object'):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(pandas_type))
+
+
+def _to_dataframe(table: pa.Table, inferred: List[str]) -> pd.DataFrame:
+    """
+    Convertit un morceau en DataFrame
+
+    Les colonnes lues en texte sans type imposé deviennent entières ou
+    décimales quand toutes leurs valeurs le permettent, comme l'inférence de
+    pandas sur chaque morceau ; les dates restent en texte.
+    """
+    for col in inferred:
+        index = table.schema.get_field_index(col)
+        column = table.column(col)
+        for col_type in INFERRED_TYPES:
+            try:
+                pc.cast(column.slice(0, INFERENCE_SAMPLE_ROWS), col_type)
+                table = table.set_column(index, col, pc.cast(column, col_type))
+                break
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                continue
+    return table.to_pandas()
+
+
+def iter_healthcare_dataframes(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                               usecols: Optional[List[str]] = None,
+                               dtype: Optional[Dict[str, str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lit le fichier CSV par morceaux de chunk_rows lignes (lecteur en flux de pyarrow)
+
+    Les blocs sont lus un à un (read_next_batch) puis regroupés en morceaux
+    de chunk_rows lignes : la conversion et l'insertion peuvent commencer
+    sans attendre la lecture complète du fichier.
+
+    Args:
+        path: Chemin du fichier CSV
+        chunk_rows: Nombre de lignes par morceau
+        usecols: Colonnes à lire (toutes par défaut)
+        dtype: Types pandas imposés par colonne, sans inférence (optionnel)
+
+    Yields:
+        Un DataFrame par morceau
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [col for col in header if usecols is None or col in usecols]
+    dtype = dtype or {}
+    # Colonnes lues en texte : l'inférence de pyarrow, faite sur le premier
+    # bloc seulement, échouerait sur un bloc suivant de type différent
+    column_types = {col: _arrow_type(dtype[col]) if col in dtype else pa.string() for col in columns}
+    inferred = [col for col in columns if col not in dtype]
+
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=DEFAULT_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns, column_types=column_types,
+            null_values=CSV_NULL_VALUES, strings_can_be_null=True))
+
+    pending = []
+    pending_rows = 0
+    while True:
+        try:
+            batch = reader.read_next_batch()
+        except StopIteration:
+            break
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunk_rows:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield _to_dataframe(table.slice(0, chunk_rows), inferred)
+            rest = table.slice(chunk_rows)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+    if pending_rows:
+        yield _to_dataframe(pa.Table.from_batches(pending, schema=reader.schema), inferred)
@@ -4,16 +4,37 @@ Permet d'exporter les données vers JSON et de les réimporter
 Avec authentification utilisateur et gestion des permissions.
 """
 
+import gzip
+import hashlib
+import io
 import json
+import functools
+import math
+from itertools import chain, islice
+import pandas as pd
 from pymongo import MongoClient
 from bson import json_util
-from datetime import datetime
 import sys
 import os
 from dotenv import load_dotenv
 from auth_helper import get_authenticated_connection, require_permission
 from batch_processor import BatchProcessor
 
+try:
+    import ijson
+except ImportError:  # ijson est optionnel, repli sur json.load (fichier chargé en entier)
+    ijson = None
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel, repli sur EXPORT_ENCODER (json standard)
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard est optionnel (installé avec pymongo[zstd]), repli sur gzip
+    zstandard = None
+
 load_dotenv()
 
 # Configuration MongoDB
@@ -24,6 +45,246 @@ MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
 DATABASE_NAME = 'healthcare_db'
 COLLECTION_NAME = 'patients'
 
+# Taille des lots d'insertion (maxWriteBatchSize du serveur: 100 000)
+MONGO_INSERT_BATCH_SIZE = int(os.getenv('MONGO_INSERT_BATCH_SIZE', 50000))
+# Threads d'envoi des lots (≤ MONGO_MAX_POOL_SIZE du client partagé)
+MONGO_INSERT_WORKERS = int(os.getenv('MONGO_INSERT_WORKERS', 8))
+# Lots en cours d'envoi au maximum : au plus MONGO_INSERT_IN_FLIGHT ×
+# MONGO_INSERT_BATCH_SIZE documents en mémoire (borne aussi le nombre de threads)
+MONGO_INSERT_IN_FLIGHT = int(os.getenv('MONGO_INSERT_IN_FLIGHT', 8))
+# Identifiant de ligne source (voir migrate_to_mongodb.ROW_KEY), conservé par
+# l'export ; index unique : une reprise de l'import ne duplique rien
+ROW_KEY_FIELD = 'row_key'
+ROW_KEY = [(ROW_KEY_FIELD, 1)]
+
+# Taille du tampon d'écriture du fichier d'export (écritures disque par blocs de 4 Mo)
+EXPORT_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Compression du fichier d'export : 'gzip' (défaut), 'zstd' ou 'none'
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'gzip')
+# Extension ajoutée au fichier selon la compression
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Champs exportés (schéma des documents patients) ; _id est exclu car
+# l'import laisse MongoDB créer de nouveaux IDs
+EXPORT_FIELDS = ['name', 'age', 'gender', 'blood_type', 'medical_condition',
+                 'date_of_admission', 'doctor', 'hospital', 'insurance_provider',
+                 'billing_amount', 'room_number', 'admission_type',
+                 'discharge_date', 'medication', 'test_results', 'row_key', 'created_at']
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS}
+EXPORT_PROJECTION['_id'] = 0
+# Champs flottants du schéma (seuls susceptibles de contenir NaN ou ±Infinity)
+EXPORT_FLOAT_FIELDS = ('billing_amount',)
+
+# Conversion des types BSON en JSON étendu relaxed ({"$date": ...}, {"$oid": ...})
+_BSON_DEFAULT = functools.partial(json_util.default, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+# Encodeur JSON de l'export : json_util.default n'est appelé que pour les types
+# BSON (ObjectId, datetime...), sans la passe de conversion préalable de
+# json_util.dumps sur chaque valeur. Sortie identique à json_util.dumps.
+EXPORT_ENCODER = json.JSONEncoder(
+    ensure_ascii=False,
+    default=_BSON_DEFAULT
+)
+
+# orjson sérialise nativement les types JSON ; les datetime lui sont retirés
+# (OPT_PASSTHROUGH_DATETIME) pour garder le format {"$date": ...} de json_util
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+# Flottants non finis : JSON ne les représente pas, json_util.dumps écrit
+# {"$numberDouble": ...} (l'encodeur json écrirait NaN, invalide, et orjson null)
+def _non_finite_double(value):
+    """Forme JSON étendu d'un flottant non fini"""
+    if value != value:
+        return {'$numberDouble': 'NaN'}
+    return {'$numberDouble': 'Infinity' if value > 0 else '-Infinity'}
+
+def encode_document(doc):
+    """Encode un document en JSON étendu relaxed (bytes UTF-8)"""
+    # Schéma plat et connu : seuls les champs flottants peuvent être non finis
+    # (copie uniquement pour les rares documents contenant NaN ou ±Infinity)
+    for field in EXPORT_FLOAT_FIELDS:
+        value = doc.get(field)
+        if type(value) is float and not math.isfinite(value):
+            doc = {**doc, field: _non_finite_double(value)}
+    if orjson is not None:
+        return orjson.dumps(doc, default=_BSON_DEFAULT, option=ORJSON_OPTIONS)
+    return EXPORT_ENCODER.encode(doc).encode('utf-8')
+
+def resolve_compression(compression=None):
+    """Retourne la compression effective (repli sur gzip si zstandard est absent)"""
+    compression = compression or EXPORT_COMPRESSION
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Compression inconnue: {compression!r} (attendu: {list(COMPRESSION_SUFFIXES)})")
+    if compression == 'zstd' and zstandard is None:
+        print("⚠ zstandard n'est pas installé, compression gzip utilisée")
+        compression = 'gzip'
+    return compression
+
+def compression_from_path(path):
+    """Déduit la compression de l'extension du fichier ('none' si non reconnue)"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return 'none'
+
+def compressed_path(path, compression):
+    """
+    Ajoute au chemin l'extension de la compression choisie (si absente)
+    
+    Lève ValueError si le chemin porte déjà l'extension d'une autre
+    compression (par exemple --compression none avec un fichier .gz).
+    """
+    found = compression_from_path(path)
+    if found != 'none' and found != compression:
+        raise ValueError(f"L'extension de {path} correspond à la compression {found!r}, "
+                         f"incompatible avec la compression choisie {compression!r}")
+    suffix = COMPRESSION_SUFFIXES[compression]
+    return path if path.endswith(suffix) else path + suffix
+
+def find_export_file(path):
+    """
+    Retourne le fichier d'export existant : le chemin tel quel ou sa version compressée
+    
+    Si plusieurs variantes existent (par exemple un ancien export non
+    compressé à côté du .gz), la plus récente est retenue.
+    """
+    candidates = [path + suffix for suffix in ('', '.gz', '.zst') if os.path.exists(path + suffix)]
+    if not candidates:
+        return None
+    newest = max(candidates, key=os.path.getmtime)
+    if len(candidates) > 1:
+        print(f"⚠ Plusieurs exports trouvés ({', '.join(candidates)}), le plus récent est utilisé: {newest}")
+    return newest
+
+def open_export_file(path, mode, compression=None):
+    """
+    Ouvre un fichier d'export en binaire, compressé selon la compression donnée
+    
+    Args:
+        path: Chemin du fichier
+        mode: 'rb' ou 'wb'
+        compression: 'gzip', 'zstd' ou 'none' ; par défaut déduite de
+            l'extension (.gz : gzip, .zst : zstandard, sinon non compressé)
+    """
+    if compression is None:
+        compression = compression_from_path(path)
+    if compression == 'gzip':
+        raw = gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("Le module zstandard est requis pour les fichiers .zst")
+        raw = zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1))
+    else:
+        return open(path, mode, buffering=EXPORT_BUFFER_SIZE)
+    
+    # Regrouper les petites écritures (un document) avant la compression
+    if 'w' in mode:
+        return io.BufferedWriter(raw, buffer_size=EXPORT_BUFFER_SIZE)
+    return raw
+
+def dump_stream(documents, f):
+    """
+    Écrit les documents dans f sous forme de tableau JSON, un document par ligne
+    
+    Chaque document est encodé directement en bytes (sans chaîne ni objet
+    intermédiaire) ; le tampon du fichier regroupe les écritures.
+    
+    Returns:
+        Nombre de documents écrits
+    """
+    write = f.write
+    count = 0
+    write(b'[')
+    for doc in documents:
+        write(b',\n' if count else b'\n')
+        write(encode_document(doc))
+        count += 1
+    write(b'\n]\n')
+    return count
+
+# Champs de dates à reconvertir en datetime lors de l'import
+DATE_FIELDS = ('date_of_admission', 'discharge_date', 'created_at')
+
+def parse_date_fields(documents):
+    """
+    Convertit en datetime les dates restées sous forme de chaîne ISO 8601
+    
+    Chaque champ est analysé en un seul appel vectorisé à pd.to_datetime ; les
+    valeurs non reconnues sont laissées telles quelles.
+    """
+    # Alias locaux : évitent une recherche globale par document dans les boucles
+    isna = pd.isna
+    to_datetime = pd.to_datetime
+    for field in DATE_FIELDS:
+        targets = [doc for doc in documents if type(doc.get(field)) is str]
+        if not targets:
+            continue
+        parsed = to_datetime(pd.Series([doc[field] for doc in targets]),
+                             format='ISO8601', utc=True, errors='coerce')
+        for doc, value in zip(targets, parsed.array.to_pydatetime()):
+            if not isna(value):
+                doc[field] = value
+
+# Types conteneurs parcourus par restore_bson_types
+_JSON_CONTAINERS = (dict, list)
+
+def restore_bson_types(value):
+    """Reconvertit récursivement le JSON étendu ({"$date": ...}, {"$oid": ...}) en types BSON"""
+    # Les valeurs scalaires sont recopiées sans appel récursif
+    containers = _JSON_CONTAINERS
+    if isinstance(value, dict):
+        return json_util.object_hook({
+            k: restore_bson_types(v) if isinstance(v, containers) else v
+            for k, v in value.items()
+        })
+    if isinstance(value, list):
+        return [restore_bson_types(v) if isinstance(v, containers) else v for v in value]
+    return value
+
+def document_row_key(doc, position):
+    """Clé de ligne 'position:empreinte' d'un document (created_at exclu)"""
+    content = {field: doc[field] for field in EXPORT_FIELDS if field in doc and field != 'created_at'}
+    return f"{position}:{hashlib.blake2b(encode_document(content), digest_size=8).hexdigest()}"
+
+def iter_json_documents(input_file, chunk_size):
+    """
+    Lit le tableau JSON exporté document par document
+    
+    Avec ijson, la mémoire utilisée reste de l'ordre de chunk_size documents.
+    Les dates sont converties par morceaux et le champ _id est supprimé pour
+    laisser MongoDB créer de nouveaux IDs. Un document sans row_key (export
+    antérieur, document créé hors migration) en reçoit une à partir de sa
+    position dans le fichier et de son contenu.
+    """
+    position = 0
+    with open_export_file(input_file, 'rb') as f:
+        if ijson is not None:
+            items = (restore_bson_types(doc) for doc in ijson.items(f, 'item', use_float=True))
+        elif orjson is not None:
+            items = iter(restore_bson_types(orjson.loads(f.read())))
+        else:
+            items = iter(json.load(f, object_hook=json_util.object_hook))
+        
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                return
+            
+            # Convertir les dates string en datetime
+            parse_date_fields(chunk)
+            
+            # Supprimer le champ _id pour permettre la création de nouveaux IDs
+            # (absent des exports récents, voir EXPORT_PROJECTION)
+            for doc in chunk:
+                doc.pop('_id', None)
+                if ROW_KEY_FIELD not in doc:
+                    doc[ROW_KEY_FIELD] = document_row_key(doc, position)
+                position += 1
+            yield from chunk
+
 def get_connection():
     """Établit la connexion à MongoDB avec authentification"""
     client, user_info = get_authenticated_connection()
@@ -32,8 +293,14 @@ def get_connection():
         sys.exit(1)
     return client, user_info
 
-def export_to_json(output_file='exported_data.json'):
-    """Exporte les données MongoDB vers un fichier JSON"""
+def export_to_json(output_file='exported_data.json', compression=None):
+    """Exporte les données MongoDB vers un fichier JSON (compressé selon EXPORT_COMPRESSION)"""
+    try:
+        compression = resolve_compression(compression)
+        output_file = compressed_path(output_file, compression)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return
     print(f"\n=== Export vers {output_file} ===")
     
     client, user_info = get_connection()
@@ -43,32 +310,34 @@ def export_to_json(output_file='exported_data.json'):
     collection = db[COLLECTION_NAME]
     
     try:
-        # Récupérer tous les documents
-        documents = list(collection.find())
-        print(f"✓ {len(documents)} documents récupérés")
-        
-        # Convertir en JSON (gérer les types BSON comme ObjectId et datetime)
-        json_data = json.loads(json_util.dumps(documents))
-        
-        # Sauvegarder dans un fichier
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False, default=str)
+        # Session explicite : sans elle, le serveur peut expirer la session
+        # implicite du curseur (et donc le curseur) après 30 minutes
+        # d'inactivité, malgré no_cursor_timeout
+        with client.start_session() as session:
+            # Parcourir le curseur et écrire chaque document au fil de l'eau
+            # (encode_document gère les types BSON comme ObjectId et datetime)
+            with collection.find({}, EXPORT_PROJECTION, batch_size=5000,
+                                 no_cursor_timeout=True, session=session) as cursor:
+                with open_export_file(output_file, 'wb', compression) as f:
+                    count = dump_stream(cursor, f)
         
+        print(f"✓ {count} documents récupérés")
         print(f"✓ Données exportées vers {output_file}")
         print(f"  Taille du fichier: {os.path.getsize(output_file) / 1024 / 1024:.2f} MB")
         
     except Exception as e:
         print(f"✗ Erreur lors de l'export: {e}")
-    finally:
-        client.close()
 
 def import_from_json(input_file='exported_data.json', target_collection='patients_backup'):
     """Importe les données depuis un fichier JSON vers MongoDB"""
-    print(f"\n=== Import depuis {input_file} ===")
-    
-    if not os.path.exists(input_file):
+    # Accepter le nom non compressé d'un export compressé (exported_data.json -> .json.gz)
+    found_file = find_export_file(input_file)
+    if found_file is None:
+        print(f"\n=== Import depuis {input_file} ===")
         print(f"✗ Fichier non trouvé: {input_file}")
         return
+    input_file = found_file
+    print(f"\n=== Import depuis {input_file} ===")
     
     client, user_info = get_connection()
     require_permission(user_info, 'import', 'importer des données')
@@ -77,55 +346,30 @@ def import_from_json(input_file='exported_data.json', target_collection='patient
     collection = db[target_collection]
     
     try:
-        # Lire le fichier JSON
-        with open(input_file, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
-        
-        print(f"✓ {len(json_data)} documents chargés depuis {input_file}")
-        
-        # Convertir les données JSON en format BSON
-        documents = []
-        for doc in json_data:
-            # Convertir les dates string en datetime
-            if 'date_of_admission' in doc and isinstance(doc['date_of_admission'], str):
-                try:
-                    doc['date_of_admission'] = datetime.fromisoformat(doc['date_of_admission'].replace('Z', '+00:00'))
-                except:
-                    pass
-            if 'discharge_date' in doc and isinstance(doc['discharge_date'], str):
-                try:
-                    doc['discharge_date'] = datetime.fromisoformat(doc['discharge_date'].replace('Z', '+00:00'))
-                except:
-                    pass
-            if 'created_at' in doc and isinstance(doc['created_at'], str):
-                try:
-                    doc['created_at'] = datetime.fromisoformat(doc['created_at'].replace('Z', '+00:00'))
-                except:
-                    pass
-            
-            # Supprimer le champ _id pour permettre la création de nouveaux IDs
-            if '_id' in doc:
-                del doc['_id']
-            
-            documents.append(doc)
+        # Lire le fichier JSON au fil de l'eau
+        documents = iter_json_documents(input_file, MONGO_INSERT_BATCH_SIZE)
+        first = next(documents, None)
         
         # Insérer dans MongoDB par lots
-        if documents:
+        if first is not None:
             print(f"\n=== Import par lots ===")
             
             # Créer le processeur de lots
             batch_processor = BatchProcessor(
                 collection=collection,
-                batch_size=5000,  # Taille de lot configurable (défaut: 5000)
-                state_file=f"batch_state_import_{target_collection}.json",
+                batch_size=MONGO_INSERT_BATCH_SIZE,  # Configurable via MONGO_INSERT_BATCH_SIZE
+                max_workers=MONGO_INSERT_WORKERS,
+                max_in_flight=MONGO_INSERT_IN_FLIGHT,
+                unique_key=ROW_KEY,
+                state_file=f"batch_state_import_{target_collection}.log",
                 operation_name=f"import_{target_collection}"
             )
             
             # Fonction de validation finale
             def validate_import(col):
                 """Valide l'import après insertion"""
-                total_imported = col.count_documents({})
-                expected = len(documents)
+                total_imported = col.estimated_document_count()
+                expected = batch_processor.stats['total_items']
                 if total_imported >= expected:
                     print(f"✓ Validation: {total_imported} documents dans la collection '{target_collection}'")
                     return True
@@ -135,14 +379,16 @@ def import_from_json(input_file='exported_data.json', target_collection='patient
             
             # Traiter par lots avec reprise automatique
             stats = batch_processor.process_batches(
-                items=documents,
+                items=chain([first], documents),
                 operation='insert',
                 resume=True,  # Permet la reprise en cas d'erreur
                 validate_callback=validate_import
             )
             
-            print(f"\n✓ Import terminé dans la collection '{target_collection}'")
-            print(f"  Nombre total de documents: {collection.count_documents({})}")
+            print(f"\n✓ {stats['total_items']} documents lus depuis {input_file}")
+            print(f"✓ Import terminé dans la collection '{target_collection}'")
+            print(f"  Nombre total de documents: {collection.estimated_document_count()}")
+            print(f"  Documents insérés par cette exécution: {stats['inserted_items']}")
             
             # Vérifier s'il y a eu des erreurs
             if stats['failed_batches'] > 0:
@@ -157,8 +403,6 @@ def import_from_json(input_file='exported_data.json', target_collection='patient
     except Exception as e:
         print(f"\n✗ Erreur lors de l'import: {e}")
         print("  L'état a été sauvegardé. Vous pouvez relancer l'import pour reprendre.")
-    finally:
-        client.close()
 
 def main():
     """Fonction principale"""
@@ -168,11 +412,13 @@ def main():
     parser.add_argument('action', choices=['export', 'import'], help='Action à effectuer')
     parser.add_argument('--file', '-f', default='exported_data.json', help='Fichier JSON')
     parser.add_argument('--collection', '-c', default='patients_backup', help='Collection cible (pour import)')
+    parser.add_argument('--compression', choices=list(COMPRESSION_SUFFIXES), default=None,
+                        help=f"Compression de l'export (défaut: {EXPORT_COMPRESSION})")
     
     args = parser.parse_args()
     
     if args.action == 'export':
-        export_to_json(args.file)
+        export_to_json(args.file, args.compression)
     elif args.action == 'import':
         import_from_json(args.file, args.collection)
 
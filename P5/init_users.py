@@ -3,7 +3,7 @@ Script d'initialisation du système d'authentification
 Crée les rôles et un utilisateur admin par défaut
 """
 
-from user_management import UserManager
+from user_management import UserManager, close_client
 
 def main():
     """Initialise le système d'authentification"""
@@ -33,7 +33,7 @@ def main():
     except Exception as e:
         print(f"\n✗ Erreur lors de l'initialisation: {e}")
     finally:
-        manager.close()
+        close_client()
 
 if __name__ == "__main__":
     main()
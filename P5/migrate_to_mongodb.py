@@ -5,14 +5,17 @@ avec validation et gestion des erreurs.
 Avec authentification utilisateur et gestion des permissions.
 """
 
+import numpy as np
 import pandas as pd
 from pymongo import MongoClient
 from datetime import datetime
 import sys
 import os
+from itertools import chain, repeat
 from dotenv import load_dotenv
 from auth_helper import get_authenticated_connection, require_permission
 from batch_processor import BatchProcessor
+from csv_loader import iter_healthcare_dataframes
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -25,6 +28,44 @@ MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
 DATABASE_NAME = 'healthcare_db'
 COLLECTION_NAME = 'patients'
 
+# Taille des lots d'insertion (maxWriteBatchSize du serveur: 100 000)
+MONGO_INSERT_BATCH_SIZE = int(os.getenv('MONGO_INSERT_BATCH_SIZE', 50000))
+# Threads d'envoi des lots (≤ MONGO_MAX_POOL_SIZE du client partagé)
+MONGO_INSERT_WORKERS = int(os.getenv('MONGO_INSERT_WORKERS', 8))
+# Lots en cours d'envoi au maximum : au plus MONGO_INSERT_IN_FLIGHT ×
+# MONGO_INSERT_BATCH_SIZE documents en mémoire (borne aussi le nombre de threads)
+MONGO_INSERT_IN_FLIGHT = int(os.getenv('MONGO_INSERT_IN_FLIGHT', 8))
+# Nombre de lignes lues, validées et converties à la fois
+CSV_CHUNK_ROWS = int(os.getenv('CSV_CHUNK_ROWS', 50000))
+# Identifiant de ligne source : position dans le CSV et empreinte du contenu
+# complet de la ligne (index unique : une reprise ne duplique rien, deux lignes
+# distinctes ne sont jamais confondues)
+ROW_KEY_FIELD = 'row_key'
+ROW_KEY = [(ROW_KEY_FIELD, 1)]
+
+# Correspondance colonne CSV -> champ MongoDB (snake_case)
+COLUMN_FIELDS = {
+    'Name': 'name',
+    'Age': 'age',
+    'Gender': 'gender',
+    'Blood Type': 'blood_type',
+    'Medical Condition': 'medical_condition',
+    'Date of Admission': 'date_of_admission',
+    'Doctor': 'doctor',
+    'Hospital': 'hospital',
+    'Insurance Provider': 'insurance_provider',
+    'Billing Amount': 'billing_amount',
+    'Room Number': 'room_number',
+    'Admission Type': 'admission_type',
+    'Discharge Date': 'discharge_date',
+    'Medication': 'medication',
+    'Test Results': 'test_results'
+}
+REQUIRED_COLUMNS = list(COLUMN_FIELDS)
+DATE_COLUMNS = ['Date of Admission', 'Discharge Date']
+INT_COLUMNS = ['Age', 'Room Number']
+FLOAT_COLUMNS = ['Billing Amount']
+
 def connect_mongodb():
     """Établit la connexion à MongoDB avec authentification"""
     client, user_info = get_authenticated_connection()
@@ -38,95 +79,134 @@ def connect_mongodb():
     print(f"✓ Connexion à MongoDB réussie pour {user_info['username']} (rôle: {user_info['role']})")
     return client, user_info
 
-def validate_data(df):
-    """Valide l'intégrité des données avant la migration"""
+def validate_data(chunks):
+    """
+    Valide l'intégrité des données avant la migration
+    
+    Les morceaux du CSV sont validés un par un ; seuls des résumés (valeurs
+    manquantes, empreintes des lignes, bornes) sont conservés entre deux
+    morceaux.
+    
+    Returns:
+        Tuple (validation réussie, nombre de lignes)
+    """
     print("\n=== Validation des données ===")
     
     issues = []
+    total_rows = 0
+    missing_values = None
+    row_hashes = []
+    age_min, age_max, billing_min = np.inf, -np.inf, np.inf
     
-    # Vérifier les colonnes requises
-    required_columns = ['Name', 'Age', 'Gender', 'Blood Type', 'Medical Condition', 
-                       'Date of Admission', 'Doctor', 'Hospital', 'Insurance Provider',
-                       'Billing Amount', 'Room Number', 'Admission Type', 
-                       'Discharge Date', 'Medication', 'Test Results']
+    for df in chunks:
+        # Vérifier les colonnes requises (sur le premier morceau)
+        if missing_values is None:
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+            if missing_columns:
+                issues.append(f"Colonnes manquantes: {missing_columns}")
+                break
+            missing_values = df.isnull().sum()
+        else:
+            missing_values = missing_values.add(df.isnull().sum(), fill_value=0)
+        total_rows += len(df)
+        
+        # Empreinte de chaque ligne pour détecter les doublons entre morceaux
+        row_hashes.append(pd.util.hash_pandas_object(df, index=False).to_numpy())
+        bounds = df.agg({'Age': ['min', 'max'], 'Billing Amount': ['min']})
+        age_min = min(age_min, bounds.at['min', 'Age'])
+        age_max = max(age_max, bounds.at['max', 'Age'])
+        billing_min = min(billing_min, bounds.at['min', 'Billing Amount'])
+        
+        # Vérifier les types de données (types numpy ou nullables Int64/Float64)
+        if not pd.api.types.is_integer_dtype(df['Age']):
+            issues.append("La colonne 'Age' doit être de type entier")
+        
+        if not pd.api.types.is_float_dtype(df['Billing Amount']):
+            issues.append("La colonne 'Billing Amount' doit être de type float")
     
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        issues.append(f"Colonnes manquantes: {missing_columns}")
+    duplicates = 0
+    if row_hashes:
+        hashes = np.concatenate(row_hashes)
+        duplicates = len(hashes) - len(np.unique(hashes))
     
     # Vérifier les valeurs manquantes
-    missing_values = df.isnull().sum()
-    if missing_values.any():
+    if missing_values is not None and missing_values.any():
         issues.append(f"Valeurs manquantes:\n{missing_values[missing_values > 0]}")
     
-    # Vérifier les types de données
-    if df['Age'].dtype != 'int64':
-        issues.append("La colonne 'Age' doit être de type entier")
-    
-    if df['Billing Amount'].dtype != 'float64':
-        issues.append("La colonne 'Billing Amount' doit être de type float")
-    
     # Vérifier les doublons
-    duplicates = df.duplicated().sum()
     if duplicates > 0:
         issues.append(f"Nombre de doublons trouvés: {duplicates}")
     
     # Vérifier les valeurs aberrantes
-    if (df['Age'] < 0).any() or (df['Age'] > 150).any():
+    if age_min < 0 or age_max > 150:
         issues.append("Valeurs d'âge aberrantes détectées")
     
-    if (df['Billing Amount'] < 0).any():
+    if billing_min < 0:
         issues.append("Montants de facturation négatifs détectés")
     
+    # Une colonne de type incorrect n'est signalée qu'une fois
+    issues = list(dict.fromkeys(issues))
+    
     if issues:
         print("⚠ Problèmes détectés:")
         for issue in issues:
             print(f"  - {issue}")
-        return False
+        return False, total_rows
     else:
         print("✓ Toutes les validations sont passées")
-        print(f"  - Nombre de lignes: {len(df)}")
-        print(f"  - Colonnes: {len(df.columns)}")
+        print(f"  - Nombre de lignes: {total_rows}")
+        print(f"  - Colonnes: {len(REQUIRED_COLUMNS)}")
         print(f"  - Doublons: {duplicates}")
-        return True
+        return True, total_rows
 
-def convert_to_documents(df):
-    """Convertit le DataFrame pandas en documents MongoDB"""
-    documents = []
-    
-    for _, row in df.iterrows():
-        # Convertir les dates
-        try:
-            date_admission = datetime.strptime(row['Date of Admission'], '%Y-%m-%d')
-        except:
-            date_admission = row['Date of Admission']
-        
-        try:
-            date_discharge = datetime.strptime(row['Discharge Date'], '%Y-%m-%d')
-        except:
-            date_discharge = row['Discharge Date']
-        
-        document = {
-            'name': row['Name'],
-            'age': int(row['Age']),
-            'gender': row['Gender'],
-            'blood_type': row['Blood Type'],
-            'medical_condition': row['Medical Condition'],
-            'date_of_admission': date_admission,
-            'doctor': row['Doctor'],
-            'hospital': row['Hospital'],
-            'insurance_provider': row['Insurance Provider'],
-            'billing_amount': float(row['Billing Amount']),
-            'room_number': int(row['Room Number']),
-            'admission_type': row['Admission Type'],
-            'discharge_date': date_discharge,
-            'medication': row['Medication'],
-            'test_results': row['Test Results'],
-            'created_at': datetime.now()
-        }
-        documents.append(document)
-    
-    return documents
+def _column_values(series, column):
+    """Convertit une colonne en liste de valeurs Python natives (conversion vectorisée)"""
+    if column in DATE_COLUMNS:
+        parsed = pd.to_datetime(series, format='%Y-%m-%d', errors='coerce')
+        values = parsed.array.to_pydatetime().tolist()
+        # Les dates invalides conservent leur valeur d'origine : seules les
+        # positions en échec (masque NumPy) sont reprises une par une
+        invalid = np.flatnonzero(parsed.isna().to_numpy())
+        if len(invalid):
+            originals = series.to_numpy()
+            for position in invalid.tolist():
+                values[position] = originals[position]
+        return values
+    if column in INT_COLUMNS:
+        return series.to_numpy(dtype=np.int64).tolist()
+    if column in FLOAT_COLUMNS:
+        return series.to_numpy(dtype=np.float64).tolist()
+    return series.tolist()
+
+def row_keys(df, start=0):
+    """Clés de ligne 'position:empreinte' (empreinte vectorisée de toutes les colonnes)"""
+    hashes = pd.util.hash_pandas_object(df[REQUIRED_COLUMNS], index=False).to_numpy()
+    return [f"{position}:{row_hash:016x}"
+            for position, row_hash in zip(range(start, start + len(df)), hashes.tolist())]
+
+def convert_to_documents(df, start=0):
+    """
+    Convertit le DataFrame pandas en documents MongoDB
+    
+    Args:
+        df: Morceau du CSV
+        start: Position de la première ligne du morceau dans le fichier
+    """
+    # Une liste de valeurs par colonne, puis assemblage des documents ligne à ligne
+    fields = list(COLUMN_FIELDS.values()) + [ROW_KEY_FIELD, 'created_at']
+    columns = [_column_values(df[column], column) for column in REQUIRED_COLUMNS]
+    columns.append(row_keys(df, start))
+    # Même horodatage pour tout le morceau, sans liste de len(df) références
+    columns.append(repeat(datetime.now()))
+    
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+def iter_documents(csv_path):
+    """Lit, convertit et renvoie les documents morceau par morceau"""
+    start = 0
+    for df in iter_healthcare_dataframes(csv_path, CSV_CHUNK_ROWS):
+        yield from convert_to_documents(df, start)
+        start += len(df)
 
 def migrate_data():
     """Fonction principale de migration"""
@@ -152,12 +232,12 @@ def migrate_data():
             print(f"  - {path}")
         sys.exit(1)
     
-    print(f"Lecture du fichier CSV: {csv_path}")
-    df = pd.read_csv(csv_path)
-    print(f"✓ {len(df)} lignes chargées\n")
+    print(f"Lecture du fichier CSV: {csv_path} (morceaux de {CSV_CHUNK_ROWS} lignes)")
     
-    # Valider les données
-    if not validate_data(df):
+    # Valider les données (première lecture, morceau par morceau)
+    is_valid, total_rows = validate_data(iter_healthcare_dataframes(csv_path, CSV_CHUNK_ROWS))
+    print(f"✓ {total_rows} lignes lues\n")
+    if not is_valid:
         print("\n✗ La validation a échoué. Migration annulée.")
         sys.exit(1)
     
@@ -166,38 +246,42 @@ def migrate_data():
     db = client[DATABASE_NAME]
     collection = db[COLLECTION_NAME]
     
-    # Vérifier si la collection existe déjà
-    if collection.count_documents({}) > 0:
+    # Vérifier si la collection existe déjà (métadonnées, sans parcours)
+    if collection.estimated_document_count() > 0:
         response = input(f"\n⚠ La collection '{COLLECTION_NAME}' contient déjà des données. Voulez-vous la vider? (o/n): ")
         if response.lower() == 'o':
             collection.delete_many({})
             print("✓ Collection vidée")
         else:
             print("Migration annulée")
-            client.close()
             sys.exit(0)
     
-    # Convertir en documents MongoDB
-    print("\n=== Conversion des données ===")
-    documents = convert_to_documents(df)
-    print(f"✓ {len(documents)} documents préparés")
-    
-    # Insérer les documents par lots
-    print("\n=== Insertion dans MongoDB (traitement par lots) ===")
+    # Convertir et insérer les documents par lots : chaque morceau du CSV est
+    # converti pendant que les lots précédents sont envoyés par les threads
+    print("\n=== Conversion et insertion dans MongoDB (traitement par lots) ===")
     try:
+        # Premier document conservé en mémoire pour l'exemple affiché à la fin
+        documents = iter_documents(csv_path)
+        sample = next(documents, None)
+        if sample is not None:
+            documents = chain([sample], documents)
+        
         # Créer le processeur de lots
         batch_processor = BatchProcessor(
             collection=collection,
-            batch_size=5000,  # Taille de lot configurable (défaut: 5000)
-            state_file="batch_state_migration.json",
+            batch_size=MONGO_INSERT_BATCH_SIZE,  # Configurable via MONGO_INSERT_BATCH_SIZE
+            max_workers=MONGO_INSERT_WORKERS,
+            max_in_flight=MONGO_INSERT_IN_FLIGHT,
+            unique_key=ROW_KEY,
+            state_file="batch_state_migration.log",
             operation_name="migration"
         )
         
         # Fonction de validation finale
         def validate_migration(col):
             """Valide la migration après insertion"""
-            total_inserted = col.count_documents({})
-            expected = len(documents)
+            total_inserted = col.estimated_document_count()
+            expected = total_rows
             if total_inserted == expected:
                 print(f"✓ Validation: {total_inserted} documents dans la collection (attendu: {expected})")
                 return True
@@ -210,17 +294,18 @@ def migrate_data():
             items=documents,
             operation='insert',
             resume=True,  # Permet la reprise en cas d'erreur
-            validate_callback=validate_migration
+            validate_callback=validate_migration,
+            total_items=total_rows
         )
         
         # Afficher quelques statistiques
         print("\n=== Statistiques finales ===")
         print(f"Base de données: {DATABASE_NAME}")
         print(f"Collection: {COLLECTION_NAME}")
-        print(f"Nombre total de documents: {collection.count_documents({})}")
+        print(f"Nombre total de documents: {collection.estimated_document_count()}")
+        print(f"Documents insérés par cette exécution: {stats['inserted_items']}")
         
-        # Afficher un exemple de document
-        sample = collection.find_one()
+        # Afficher un exemple de document (sans relecture dans MongoDB)
         if sample:
             print(f"\nExemple de document:")
             for key, value in sample.items():
@@ -240,9 +325,6 @@ def migrate_data():
         print(f"\n✗ Erreur lors de l'insertion: {e}")
         print("  L'état a été sauvegardé. Vous pouvez relancer le script pour reprendre.")
         sys.exit(1)
-    finally:
-        client.close()
-        print("\n✓ Connexion fermée")
 
 if __name__ == "__main__":
     migrate_data()
@@ -4,13 +4,22 @@ Teste les données avant et après la migration vers MongoDB
 Avec authentification utilisateur et gestion des permissions.
 """
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 from pymongo import MongoClient
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred
 from datetime import datetime
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from auth_helper import get_authenticated_connection, require_permission
+from csv_loader import CSV_NULL_VALUES
 
 load_dotenv()
 
@@ -22,6 +31,44 @@ MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
 DATABASE_NAME = 'healthcare_db'
 COLLECTION_NAME = 'patients'
 
+# Colonnes attendues dans le CSV (seules colonnes lues)
+REQUIRED_COLUMNS = ['Name', 'Age', 'Gender', 'Blood Type', 'Medical Condition',
+                    'Date of Admission', 'Doctor', 'Hospital', 'Insurance Provider',
+                    'Billing Amount', 'Room Number', 'Admission Type',
+                    'Discharge Date', 'Medication', 'Test Results']
+# Champs attendus dans chaque document MongoDB
+REQUIRED_FIELDS = ['name', 'age', 'gender', 'blood_type', 'medical_condition',
+                   'date_of_admission', 'doctor', 'hospital', 'insurance_provider',
+                   'billing_amount', 'room_number', 'admission_type',
+                   'discharge_date', 'medication', 'test_results']
+REQUIRED_FIELD_SET = frozenset(REQUIRED_FIELDS)
+REQUIRED_FIELDS_PROJECTION = {'_id': 0, **{field: 1 for field in REQUIRED_FIELDS}}
+# Types numériques imposés à la lecture (types Arrow, au plus étroit : l'âge reste
+# sur 16 bits pour que les valeurs aberrantes > 150 restent représentables ; le
+# montant reste sur 64 bits, l'arrondi en 32 bits confondrait des lignes
+# distinctes dans le test des doublons)
+CSV_DTYPES = {
+    'Age': 'int16',
+    'Billing Amount': 'float64',
+    'Room Number': 'int16'
+}
+# Valeurs aberrantes : libellé -> (colonne, minimum accepté, maximum accepté)
+# Les tests portent sur les bornes observées, calculées avec les statistiques
+OUTLIER_BOUNDS = {
+    "Âges aberrants (< 0 ou > 150)": ('Age', 0, 150),
+    "Montants de facturation négatifs": ('Billing Amount', 0, None),
+    "Numéros de chambre négatifs": ('Room Number', 0, None)
+}
+NUMERIC_COLUMNS = ['Age', 'Billing Amount', 'Room Number']
+# Taille des blocs lus dans le CSV (le résumé est agrégé bloc par bloc)
+CSV_BLOCK_SIZE = int(os.getenv('CSV_BLOCK_SIZE', 16 * 1024 * 1024))
+
+def find_outliers(bounds):
+    """Libellés des valeurs aberrantes d'après les bornes observées {colonne: (min, max)}"""
+    return [label for label, (col, low, high) in OUTLIER_BOUNDS.items()
+            if col in bounds and ((low is not None and bounds[col][0] < low)
+                                  or (high is not None and bounds[col][1] > high))]
+
 class DataIntegrityTester:
     """Classe pour tester l'intégrité des données"""
     
@@ -42,9 +89,191 @@ class DataIntegrityTester:
         self.client = None
         self.db = None
         self.collection = None
+        # Résumé du CSV, calculé une seule fois (voir summarize_csv)
+        self._csv_summary = None
+        self._csv_lock = threading.Lock()
+        # Nombre de documents MongoDB (voir count_mongo_documents)
+        self._mongo_count = None
+        # Lignes du rapport en cours, écrites en une fois (voir _flush_log)
+        self._log = []
+    
+    def summarize_csv(self):
+        """
+        Parcourt le CSV et met en cache un résumé pour les tests
+        
+        Le fichier est lu par blocs Arrow (analyse multi-thread) et le résumé
+        est agrégé bloc par bloc, sans charger tout le CSV. Un appel concurrent attend
+        le parcours en cours au lieu d'en lancer un second.
+        """
+        with self._csv_lock:
+            if self._csv_summary is None:
+                self._csv_summary = self._compute_csv_summary()
+            return self._csv_summary
+    
+    def _compute_csv_summary(self):
+        """Calcule le résumé du CSV"""
+        header = pd.read_csv(self.csv_path, nrows=0).columns
+        usecols = [col for col in REQUIRED_COLUMNS if col in header]
+        summary = self._summarize_arrow(usecols)
+        summary['columns'] = list(header)
+        return summary
+    
+    def _summarize_arrow(self, usecols):
+        """Calcule le résumé du CSV bloc par bloc (mémoire bornée par CSV_BLOCK_SIZE)"""
+        column_types = {col: getattr(pa, col_type)() for col, col_type in CSV_DTYPES.items() if col in usecols}
+        # Colonnes textuelles lues telles quelles : pas d'inférence de type sur
+        # le premier bloc qui pourrait échouer sur un bloc suivant
+        read_types = {col: pa.string() for col in usecols if col not in column_types}
+        try:
+            return self._scan_csv_batches(usecols, {**read_types, **column_types}, {})
+        except pa.ArrowInvalid:
+            # Valeurs non convertibles : colonnes numériques lues en texte puis
+            # converties bloc par bloc, le test des types signalera les
+            # colonnes concernées
+            return self._scan_csv_batches(usecols, {**read_types, **dict.fromkeys(column_types, pa.string())},
+                                          column_types)
+    
+    def _scan_csv_batches(self, usecols, read_types, cast_types):
+        """
+        Parcourt les blocs Arrow du CSV et agrège le résumé
+        
+        Args:
+            usecols: Colonnes lues
+            read_types: Types Arrow imposés à la lecture
+            cast_types: Colonnes lues en texte à convertir dans chaque bloc
+                (type attendu)
+        """
+        reader = pa_csv.open_csv(
+            self.csv_path,
+            read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=usecols, column_types=read_types,
+                null_values=CSV_NULL_VALUES, strings_can_be_null=True))
+        
+        numeric_columns = [col for col in NUMERIC_COLUMNS if col in usecols]
+        rows = 0
+        missing = dict.fromkeys(usecols, 0)
+        # colonne -> [somme, nombre de valeurs, minimum, maximum]
+        stats = {col: [0.0, 0, None, None] for col in numeric_columns}
+        conditions = set()
+        # Empreinte 64 bits de chaque ligne, pour compter les doublons à la fin
+        row_hashes = []
+        wrong_types = {}
+        
+        while True:
+            try:
+                batch = reader.read_next_batch()
+            except StopIteration:
+                break
+            table = pa.Table.from_batches([batch])
+            rows += table.num_rows
+            for col in usecols:
+                missing[col] += table.column(col).null_count
+            
+            # Empreintes calculées sur les valeurs lues ; les entiers passent en
+            # float64 pour qu'un bloc avec ou sans valeur manquante (float ou
+            # entier côté pandas) donne la même empreinte
+            hashed = table
+            for col in numeric_columns:
+                if col not in cast_types:
+                    hashed = hashed.set_column(hashed.schema.get_field_index(col), col,
+                                               pc.cast(table.column(col), pa.float64()))
+            row_hashes.append(pd.util.hash_pandas_object(hashed.to_pandas(), index=False).to_numpy())
+            
+            for col in numeric_columns:
+                values = table.column(col)
+                if col in cast_types:
+                    values = self._cast_numeric(values, cast_types[col], col, wrong_types)
+                total, count, low, high = stats[col]
+                min_max = pc.min_max(values)
+                batch_low, batch_high = min_max['min'].as_py(), min_max['max'].as_py()
+                stats[col] = [
+                    total + (pc.sum(values).as_py() or 0),
+                    count + pc.count(values).as_py(),
+                    batch_low if low is None or (batch_low is not None and batch_low < low) else low,
+                    batch_high if high is None or (batch_high is not None and batch_high > high) else high
+                ]
+            
+            if 'Medical Condition' in usecols:
+                conditions.update(pc.unique(table.column('Medical Condition')).to_pylist())
+        conditions.discard(None)
+        
+        nan = float('nan')
+        bounds = {col: (nan if low is None else low, nan if high is None else high)
+                  for col, (_, _, low, high) in stats.items()}
+        means = {col: total / count if count else nan for col, (total, count, _, _) in stats.items()}
+        row_hashes = np.concatenate(row_hashes) if row_hashes else np.empty(0, dtype='uint64')
+        
+        return {
+            'rows': rows,
+            'missing_values': pd.Series(missing, dtype='int64'),
+            'duplicates': rows - len(np.unique(row_hashes)),
+            'wrong_types': wrong_types,
+            'outliers': find_outliers(bounds),
+            'age_mean': means.get('Age', nan),
+            'age_min': bounds.get('Age', (nan, nan))[0],
+            'age_max': bounds.get('Age', (nan, nan))[1],
+            'billing_mean': means.get('Billing Amount', nan),
+            'conditions': len(conditions)
+        }
+    
+    @staticmethod
+    def _cast_numeric(values, col_type, col, wrong_types):
+        """
+        Convertit une colonne lue en texte vers son type attendu
+        
+        Si la conversion perd de l'information, la colonne est notée dans
+        wrong_types (float64 si toutes ses valeurs sont des nombres, texte
+        sinon) et les valeurs non numériques sont ignorées.
+        """
+        try:
+            return pc.cast(values, col_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+        try:
+            values = pc.cast(values, pa.float64())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            wrong_types[col] = pa.string()
+            return pa.array(pd.to_numeric(values.to_pandas(), errors='coerce'), from_pandas=True)
+        try:
+            # Nombres écrits en décimal (« 8.0 ») : convertibles sans perte
+            return pc.cast(values, col_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            wrong_types.setdefault(col, pa.float64())
+            return values
+    
+    def _flush_log(self):
+        """Écrit d'un seul bloc les lignes du rapport accumulées par un test"""
+        if self._log:
+            sys.stdout.write('\n'.join(self._log) + '\n')
+            sys.stdout.flush()
+            self._log.clear()
+    
+    def count_mongo_documents(self, expected=None):
+        """
+        Compte les documents de la collection (une seule fois)
+        
+        L'estimation issue des métadonnées (O(1)) est utilisée en premier ;
+        le comptage exact (parcours complet) n'est fait que si elle diffère
+        du nombre attendu.
+        """
+        if self._mongo_count is None:
+            count = self.collection.estimated_document_count()
+            if expected is not None and count != expected:
+                count = self.collection.count_documents({})
+            self._mongo_count = count
+        return self._mongo_count
     
     def connect_mongodb(self):
-        """Établit la connexion à MongoDB avec authentification"""
+        """
+        Établit la connexion à MongoDB avec authentification
+        
+        La connexion est conservée : un nouvel appel ne redemande pas
+        l'authentification. Le client partagé du processus n'est pas fermé ici
+        (voir user_management.close_client).
+        """
+        if self.collection is not None:
+            return True
         try:
             client, user_info = get_authenticated_connection()
             if not client or not user_info:
@@ -55,7 +284,13 @@ class DataIntegrityTester:
             
             self.client = client
             self.db = self.client[DATABASE_NAME]
-            self.collection = self.db[COLLECTION_NAME]
+            # Tests en lecture seule : lecture sans attente de cohérence et
+            # déportée sur un secondaire quand il y en a un
+            self.collection = self.db.get_collection(
+                COLLECTION_NAME,
+                read_concern=ReadConcern('available'),
+                read_preference=SecondaryPreferred()
+            )
             print(f"✓ Connexion établie pour {user_info['username']} (rôle: {user_info['role']})")
             return True
         except Exception as e:
@@ -64,111 +299,96 @@ class DataIntegrityTester:
     
     def test_csv_data(self):
         """Teste l'intégrité des données CSV"""
-        print("\n" + "="*60)
-        print("TEST D'INTÉGRITÉ - DONNÉES CSV")
-        print("="*60)
+        self._log.append("\n" + "="*60)
+        self._log.append("TEST D'INTÉGRITÉ - DONNÉES CSV")
+        self._log.append("="*60)
         
         if not os.path.exists(self.csv_path):
-            print(f"✗ Fichier CSV non trouvé: {self.csv_path}")
+            self._log.append(f"✗ Fichier CSV non trouvé: {self.csv_path}")
+            self._flush_log()
             return False
         
-        df = pd.read_csv(self.csv_path)
+        summary = self.summarize_csv()
         results = {'passed': 0, 'failed': 0, 'issues': []}
         
         # Test 1: Colonnes disponibles
-        print("\n1. Test des colonnes disponibles:")
-        required_columns = ['Name', 'Age', 'Gender', 'Blood Type', 'Medical Condition',
-                           'Date of Admission', 'Doctor', 'Hospital', 'Insurance Provider',
-                           'Billing Amount', 'Room Number', 'Admission Type',
-                           'Discharge Date', 'Medication', 'Test Results']
-        missing = [col for col in required_columns if col not in df.columns]
+        self._log.append("\n1. Test des colonnes disponibles:")
+        missing = [col for col in REQUIRED_COLUMNS if col not in summary['columns']]
         if missing:
             results['failed'] += 1
             results['issues'].append(f"Colonnes manquantes: {missing}")
-            print(f"   ✗ Colonnes manquantes: {missing}")
+            self._log.append(f"   ✗ Colonnes manquantes: {missing}")
         else:
             results['passed'] += 1
-            print(f"   ✓ Toutes les colonnes requises sont présentes ({len(df.columns)} colonnes)")
+            self._log.append(f"   ✓ Toutes les colonnes requises sont présentes ({len(summary['columns'])} colonnes)")
         
         # Test 2: Types de variables
-        print("\n2. Test des types de variables:")
-        type_checks = {
-            'Age': 'int64',
-            'Billing Amount': 'float64',
-            'Room Number': 'int64'
-        }
-        type_ok = True
-        for col, expected_type in type_checks.items():
-            if df[col].dtype != expected_type:
-                type_ok = False
-                results['issues'].append(f"Type incorrect pour {col}: {df[col].dtype} au lieu de {expected_type}")
-                print(f"   ✗ {col}: {df[col].dtype} (attendu: {expected_type})")
-        if type_ok:
+        self._log.append("\n2. Test des types de variables:")
+        for col, actual_type in summary['wrong_types'].items():
+            expected_type = CSV_DTYPES[col]
+            results['issues'].append(f"Type incorrect pour {col}: {actual_type} au lieu de {expected_type}")
+            self._log.append(f"   ✗ {col}: {actual_type} (attendu: {expected_type})")
+        if not summary['wrong_types']:
             results['passed'] += 1
-            print("   ✓ Types de variables corrects")
+            self._log.append("   ✓ Types de variables corrects")
         else:
             results['failed'] += 1
         
         # Test 3: Doublons
-        print("\n3. Test des doublons:")
-        duplicates = df.duplicated().sum()
+        self._log.append("\n3. Test des doublons:")
+        duplicates = summary['duplicates']
         if duplicates > 0:
             results['failed'] += 1
             results['issues'].append(f"{duplicates} doublons trouvés")
-            print(f"   ✗ {duplicates} doublons trouvés")
+            self._log.append(f"   ✗ {duplicates} doublons trouvés")
         else:
             results['passed'] += 1
-            print("   ✓ Aucun doublon détecté")
+            self._log.append("   ✓ Aucun doublon détecté")
         
         # Test 4: Valeurs manquantes
-        print("\n4. Test des valeurs manquantes:")
-        missing_values = df.isnull().sum()
-        missing_count = missing_values.sum()
+        self._log.append("\n4. Test des valeurs manquantes:")
+        missing_values = summary['missing_values']
+        missing_count = int(missing_values.sum())
         if missing_count > 0:
             results['failed'] += 1
             missing_cols = missing_values[missing_values > 0]
             results['issues'].append(f"Valeurs manquantes: {missing_cols.to_dict()}")
-            print(f"   ✗ {missing_count} valeurs manquantes trouvées:")
+            self._log.append(f"   ✗ {missing_count} valeurs manquantes trouvées:")
             for col, count in missing_cols.items():
-                print(f"      - {col}: {count}")
+                self._log.append(f"      - {col}: {count}")
         else:
             results['passed'] += 1
-            print("   ✓ Aucune valeur manquante")
+            self._log.append("   ✓ Aucune valeur manquante")
         
         # Test 5: Valeurs aberrantes
-        print("\n5. Test des valeurs aberrantes:")
-        outliers = []
-        if (df['Age'] < 0).any() or (df['Age'] > 150).any():
-            outliers.append("Âges aberrants (< 0 ou > 150)")
-        if (df['Billing Amount'] < 0).any():
-            outliers.append("Montants de facturation négatifs")
-        if (df['Room Number'] < 0).any():
-            outliers.append("Numéros de chambre négatifs")
+        self._log.append("\n5. Test des valeurs aberrantes:")
+        outliers = summary['outliers']
         
         if outliers:
             results['failed'] += 1
             results['issues'].extend(outliers)
-            print("   ✗ Valeurs aberrantes détectées:")
+            self._log.append("   ✗ Valeurs aberrantes détectées:")
             for outlier in outliers:
-                print(f"      - {outlier}")
+                self._log.append(f"      - {outlier}")
         else:
             results['passed'] += 1
-            print("   ✓ Aucune valeur aberrante")
+            self._log.append("   ✓ Aucune valeur aberrante")
         
         # Test 6: Statistiques générales
-        print("\n6. Statistiques générales:")
-        print(f"   - Nombre total de lignes: {len(df)}")
-        print(f"   - Âge moyen: {df['Age'].mean():.2f} ans")
-        print(f"   - Âge min: {df['Age'].min()} ans")
-        print(f"   - Âge max: {df['Age'].max()} ans")
-        print(f"   - Montant moyen: ${df['Billing Amount'].mean():.2f}")
-        print(f"   - Conditions médicales uniques: {df['Medical Condition'].nunique()}")
+        self._log.append("\n6. Statistiques générales:")
+        self._log.append(f"   - Nombre total de lignes: {summary['rows']}")
+        self._log.append(f"   - Âge moyen: {summary['age_mean']:.2f} ans")
+        self._log.append(f"   - Âge min: {summary['age_min']:.0f} ans")
+        self._log.append(f"   - Âge max: {summary['age_max']:.0f} ans")
+        self._log.append(f"   - Montant moyen: ${summary['billing_mean']:.2f}")
+        self._log.append(f"   - Conditions médicales uniques: {summary['conditions']}")
         
         # Résumé
-        print("\n" + "-"*60)
-        print(f"RÉSUMÉ CSV: {results['passed']} tests réussis, {results['failed']} tests échoués")
-        print("-"*60)
+        self._log.append("\n" + "-"*60)
+        self._log.append(f"RÉSUMÉ CSV: {results['passed']} tests réussis, {results['failed']} tests échoués")
+        self._log.append("-"*60)
         
+        self._flush_log()
         return results
     
     def test_mongodb_data(self):
@@ -183,146 +403,172 @@ class DataIntegrityTester:
         results = {'passed': 0, 'failed': 0, 'issues': []}
         
         # Test 1: Connexion et collection
-        print("\n1. Test de connexion et collection:")
+        self._log.append("\n1. Test de connexion et collection:")
         try:
-            count = self.collection.count_documents({})
+            # Métadonnées de la collection (O(1)) : suffisant pour détecter une collection vide
+            count = self.collection.estimated_document_count()
             if count == 0:
                 results['failed'] += 1
                 results['issues'].append("La collection est vide")
-                print("   ✗ La collection est vide")
+                self._log.append("   ✗ La collection est vide")
             else:
                 results['passed'] += 1
-                print(f"   ✓ Collection accessible avec {count} documents")
+                self._log.append(f"   ✓ Collection accessible avec {count} documents")
         except Exception as e:
             results['failed'] += 1
             results['issues'].append(f"Erreur d'accès: {e}")
-            print(f"   ✗ Erreur: {e}")
+            self._log.append(f"   ✗ Erreur: {e}")
+            self._flush_log()
             return results
         
+        # Tests 2, 3, 4, 5 et 7 : une seule agrégation $facet, donc un seul
+        # parcours de la collection côté serveur pour tous les sous-pipelines
+        type_checks = {
+            'age': ({'int', 'long'}, "Le champ 'age' n'est pas un entier"),
+            'billing_amount': ({'int', 'long', 'double', 'decimal'}, "Le champ 'billing_amount' n'est pas un nombre"),
+            'room_number': ({'int', 'long'}, "Le champ 'room_number' n'est pas un entier")
+        }
+        null_fields = ['name', 'age', 'gender', 'medical_condition']
+        facet_stages = {
+            # Documents auxquels manque au moins un champ requis
+            'incomplete': [
+                {'$match': {'$or': [{field: {'$exists': False}} for field in REQUIRED_FIELDS]}},
+                {'$count': 'n'}
+            ],
+            # Histogramme des types BSON de chaque champ
+            **{f'types_{field}': [{'$group': {'_id': {'$type': f'${field}'}, 'n': {'$sum': 1}}}]
+               for field in type_checks},
+            # Doublons (basés sur une combinaison de champs)
+            'duplicates': [
+                {'$group': {
+                    '_id': {
+                        'name': '$name',
+                        'date_of_admission': '$date_of_admission',
+                        'hospital': '$hospital'
+                    },
+                    'count': {'$sum': 1}
+                }},
+                {'$match': {'count': {'$gt': 1}}},
+                # Seul le nombre de groupes est renvoyé, pas la liste des doublons
+                {'$count': 'n'}
+            ],
+            # Un compteur de valeurs nulles par champ critique
+            **{f'nulls_{field}': [{'$match': {field: None}}, {'$count': 'n'}]
+               for field in null_fields},
+            # Statistiques globales
+            'stats': [
+                {'$group': {
+                    '_id': None,
+                    'avg_age': {'$avg': '$age'},
+                    'min_age': {'$min': '$age'},
+                    'max_age': {'$max': '$age'},
+                    'avg_billing': {'$avg': '$billing_amount'},
+                    'total_docs': {'$sum': 1}
+                }}
+            ]
+        }
+        facets = next(self.collection.aggregate([{'$facet': facet_stages}], allowDiskUse=True), {})
+        
         # Test 2: Structure des documents
-        print("\n2. Test de la structure des documents:")
-        sample = self.collection.find_one()
-        if sample:
-            required_fields = ['name', 'age', 'gender', 'blood_type', 'medical_condition',
-                             'date_of_admission', 'doctor', 'hospital', 'insurance_provider',
-                             'billing_amount', 'room_number', 'admission_type',
-                             'discharge_date', 'medication', 'test_results']
-            missing_fields = [field for field in required_fields if field not in sample]
+        self._log.append("\n2. Test de la structure des documents:")
+        # Seuls les champs vérifiés sont transférés (projection)
+        sample = self.collection.find_one({}, REQUIRED_FIELDS_PROJECTION)
+        incomplete = next(iter(facets.get('incomplete', [])), {'n': 0})['n']
+        missing_fields = sorted(REQUIRED_FIELD_SET - sample.keys()) if sample is not None else []
+        if missing_fields or incomplete:
+            results['failed'] += 1
             if missing_fields:
-                results['failed'] += 1
                 results['issues'].append(f"Champs manquants: {missing_fields}")
-                print(f"   ✗ Champs manquants: {missing_fields}")
-            else:
-                results['passed'] += 1
-                print(f"   ✓ Tous les champs requis sont présents ({len(required_fields)} champs)")
+                self._log.append(f"   ✗ Champs manquants: {missing_fields}")
+            if incomplete:
+                results['issues'].append(f"{incomplete} documents sans tous les champs requis")
+                self._log.append(f"   ✗ {incomplete} documents sans tous les champs requis")
+        elif sample is not None:
+            results['passed'] += 1
+            self._log.append(f"   ✓ Tous les champs requis sont présents ({len(REQUIRED_FIELDS)} champs)")
         
         # Test 3: Types de données
-        print("\n3. Test des types de données:")
+        self._log.append("\n3. Test des types de données:")
         type_issues = []
-        for doc in self.collection.find().limit(100):
-            if not isinstance(doc.get('age'), int):
-                type_issues.append("Le champ 'age' n'est pas un entier")
-            if not isinstance(doc.get('billing_amount'), (int, float)):
-                type_issues.append("Le champ 'billing_amount' n'est pas un nombre")
-            if not isinstance(doc.get('room_number'), int):
-                type_issues.append("Le champ 'room_number' n'est pas un entier")
+        for field, (allowed_types, message) in type_checks.items():
+            unexpected = {group['_id']: group['n'] for group in facets.get(f'types_{field}', [])
+                          if group['_id'] not in allowed_types}
+            if unexpected:
+                details = ', '.join(f"{n} de type {bson_type}" for bson_type, n in sorted(unexpected.items()))
+                type_issues.append(f"{message} ({details})")
         
         if type_issues:
             results['failed'] += 1
-            results['issues'].extend(list(set(type_issues)))
-            print("   ✗ Problèmes de type détectés:")
-            for issue in set(type_issues):
-                print(f"      - {issue}")
+            results['issues'].extend(type_issues)
+            self._log.append("   ✗ Problèmes de type détectés:")
+            for issue in type_issues:
+                self._log.append(f"      - {issue}")
         else:
             results['passed'] += 1
-            print("   ✓ Types de données corrects")
+            self._log.append("   ✓ Types de données corrects")
         
         # Test 4: Doublons (basé sur une combinaison de champs)
-        print("\n4. Test des doublons potentiels:")
-        pipeline = [
-            {'$group': {
-                '_id': {
-                    'name': '$name',
-                    'date_of_admission': '$date_of_admission',
-                    'hospital': '$hospital'
-                },
-                'count': {'$sum': 1}
-            }},
-            {'$match': {'count': {'$gt': 1}}}
-        ]
-        duplicates = list(self.collection.aggregate(pipeline))
+        self._log.append("\n4. Test des doublons potentiels:")
+        duplicates = next(iter(facets.get('duplicates', [])), {'n': 0})['n']
         if duplicates:
             results['failed'] += 1
-            results['issues'].append(f"{len(duplicates)} doublons potentiels trouvés")
-            print(f"   ✗ {len(duplicates)} doublons potentiels détectés")
+            results['issues'].append(f"{duplicates} doublons potentiels trouvés")
+            self._log.append(f"   ✗ {duplicates} doublons potentiels détectés")
         else:
             results['passed'] += 1
-            print("   ✓ Aucun doublon détecté")
+            self._log.append("   ✓ Aucun doublon détecté")
         
         # Test 5: Valeurs nulles
-        print("\n5. Test des valeurs nulles:")
-        null_issues = []
-        for field in ['name', 'age', 'gender', 'medical_condition']:
-            count = self.collection.count_documents({field: None})
-            if count > 0:
-                null_issues.append(f"{field}: {count} valeurs nulles")
+        self._log.append("\n5. Test des valeurs nulles:")
+        null_issues = [f"{field}: {facets[f'nulls_{field}'][0]['n']} valeurs nulles"
+                       for field in null_fields if facets.get(f'nulls_{field}')]
         
         if null_issues:
             results['failed'] += 1
             results['issues'].extend(null_issues)
-            print("   ✗ Valeurs nulles trouvées:")
+            self._log.append("   ✗ Valeurs nulles trouvées:")
             for issue in null_issues:
-                print(f"      - {issue}")
+                self._log.append(f"      - {issue}")
         else:
             results['passed'] += 1
-            print("   ✓ Aucune valeur nulle dans les champs critiques")
+            self._log.append("   ✓ Aucune valeur nulle dans les champs critiques")
         
         # Test 6: Comparaison CSV vs MongoDB
-        print("\n6. Comparaison CSV vs MongoDB:")
+        self._log.append("\n6. Comparaison CSV vs MongoDB:")
         try:
-            df = pd.read_csv(self.csv_path)
-            csv_count = len(df)
-            mongo_count = self.collection.count_documents({})
+            # Résumé déjà calculé par test_csv_data (pas de seconde lecture)
+            csv_count = self.summarize_csv()['rows']
+            mongo_count = self.count_mongo_documents(expected=csv_count)
             
             if csv_count == mongo_count:
                 results['passed'] += 1
-                print(f"   ✓ Nombre de documents cohérent: {mongo_count}")
+                self._log.append(f"   ✓ Nombre de documents cohérent: {mongo_count}")
             else:
                 results['failed'] += 1
                 results['issues'].append(f"Différence de nombre: CSV={csv_count}, MongoDB={mongo_count}")
-                print(f"   ✗ Différence de nombre: CSV={csv_count}, MongoDB={mongo_count}")
+                self._log.append(f"   ✗ Différence de nombre: CSV={csv_count}, MongoDB={mongo_count}")
         except Exception as e:
             results['failed'] += 1
             results['issues'].append(f"Erreur de comparaison: {e}")
-            print(f"   ✗ Erreur: {e}")
+            self._log.append(f"   ✗ Erreur: {e}")
         
         # Statistiques MongoDB
-        print("\n7. Statistiques MongoDB:")
-        pipeline = [
-            {'$group': {
-                '_id': None,
-                'avg_age': {'$avg': '$age'},
-                'min_age': {'$min': '$age'},
-                'max_age': {'$max': '$age'},
-                'avg_billing': {'$avg': '$billing_amount'},
-                'total_docs': {'$sum': 1}
-            }}
-        ]
-        stats = list(self.collection.aggregate(pipeline))
+        self._log.append("\n7. Statistiques MongoDB:")
+        stats = facets.get('stats', [])
         if stats:
             s = stats[0]
-            print(f"   - Documents: {s['total_docs']}")
-            print(f"   - Âge moyen: {s['avg_age']:.2f} ans")
-            print(f"   - Âge min: {s['min_age']} ans")
-            print(f"   - Âge max: {s['max_age']} ans")
-            print(f"   - Montant moyen: ${s['avg_billing']:.2f}")
+            self._log.append(f"   - Documents: {s['total_docs']}")
+            self._log.append(f"   - Âge moyen: {s['avg_age']:.2f} ans")
+            self._log.append(f"   - Âge min: {s['min_age']} ans")
+            self._log.append(f"   - Âge max: {s['max_age']} ans")
+            self._log.append(f"   - Montant moyen: ${s['avg_billing']:.2f}")
         
         # Résumé
-        print("\n" + "-"*60)
-        print(f"RÉSUMÉ MONGODB: {results['passed']} tests réussis, {results['failed']} tests échoués")
-        print("-"*60)
+        self._log.append("\n" + "-"*60)
+        self._log.append(f"RÉSUMÉ MONGODB: {results['passed']} tests réussis, {results['failed']} tests échoués")
+        self._log.append("-"*60)
         
-        self.client.close()
+        self._flush_log()
         return results
     
     def run_all_tests(self):
@@ -331,8 +577,14 @@ class DataIntegrityTester:
         print("SUITE DE TESTS D'INTÉGRITÉ DES DONNÉES")
         print("="*60)
         
-        csv_results = self.test_csv_data()
-        mongo_results = self.test_mongodb_data()
+        # Le parcours du CSV (disque, CPU) se fait en arrière-plan pendant
+        # l'authentification et les requêtes MongoDB (réseau). Il n'affiche
+        # rien : le rapport CSV est imprimé ensuite à partir du résumé en cache.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if os.path.exists(self.csv_path):
+                executor.submit(self.summarize_csv)
+            mongo_results = self.test_mongodb_data()
+            csv_results = self.test_csv_data()
         
         print("\n" + "="*60)
         print("RÉSUMÉ GLOBAL")
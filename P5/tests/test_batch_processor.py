@@ -0,0 +1,153 @@
+"""
+Tests de reprise du BatchProcessor avec une collection factice (sans MongoDB)
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_processor import BatchProcessor
+
+class FakeCollection:
+    """Collection en mémoire ; insert_many échoue sur les lots contenant fail_at"""
+    
+    def __init__(self, fail_delay=0.0):
+        self.docs = []
+        self.fail_at = None
+        # Délai avant l'échec : les lots suivants se terminent avant lui
+        self.fail_delay = fail_delay
+    
+    def insert_many(self, documents, ordered=True, bypass_document_validation=False):
+        documents = list(documents)
+        if self.fail_at is not None and any(doc['i'] == self.fail_at for doc in documents):
+            time.sleep(self.fail_delay)
+            raise PyMongoError(f"échec simulé à l'index {self.fail_at}")
+        self.docs.extend(documents)
+        return SimpleNamespace(inserted_ids=[None] * len(documents))
+
+def make_items(n):
+    return [{'i': i} for i in range(n)]
+
+def make_processor(collection, state_file, max_workers=1, **kwargs):
+    return BatchProcessor(collection, batch_size=100, state_file=str(state_file),
+                          operation_name="test", max_workers=max_workers,
+                          max_in_flight=max_workers, checkpoint_every=1, **kwargs)
+
+def test_resume_after_fresh_run_ignores_older_log(tmp_path):
+    """Un nouveau départ (resume=False) remplace le journal d'une exécution antérieure"""
+    state_file = tmp_path / "batch_state_test.log"
+    collection = FakeCollection()
+    
+    # Exécution 1 : échec à l'index 800
+    collection.fail_at = 800
+    make_processor(collection, state_file).process_batches(make_items(1000))
+    
+    # Exécution 2 : redémarrage complet, échec à l'index 200
+    collection.docs.clear()
+    collection.fail_at = 200
+    make_processor(collection, state_file).process_batches(make_items(1000), resume=False)
+    
+    # Exécution 3 : reprise, doit repartir de l'index 200 et non 800
+    collection.fail_at = None
+    make_processor(collection, state_file).process_batches(make_items(1000))
+    
+    assert sorted(doc['i'] for doc in collection.docs) == list(range(1000))
+    assert not state_file.exists()
+
+def test_resume_skips_batches_completed_after_failure(tmp_path):
+    """Les lots terminés après le lot en échec ne sont pas renvoyés à la reprise"""
+    state_file = tmp_path / "batch_state_test.log"
+    collection = FakeCollection(fail_delay=0.05)
+    
+    # Lot 6 en échec pendant que les lots 7 et suivants se terminent
+    collection.fail_at = 500
+    make_processor(collection, state_file, max_workers=4).process_batches(make_items(1000))
+    assert any(doc['i'] >= 600 for doc in collection.docs)
+    
+    collection.fail_at = None
+    make_processor(collection, state_file, max_workers=4).process_batches(make_items(1000))
+    
+    assert sorted(doc['i'] for doc in collection.docs) == list(range(1000))
+
+
+def test_resume_uses_last_valid_log_line(tmp_path):
+    """Le dernier état valide du journal est retenu, une ligne tronquée est ignorée"""
+    state_file = tmp_path / "batch_state_test.log"
+    state_file.write_bytes(
+        b'{"last_processed_index": 800, "total_batches": 10, "current_batch": 8, '
+        b'"operation": "test", "timestamp": null}\n'
+        b'{"last_processed_index": 300, "total_batches": 10, "current_batch": 3, '
+        b'"operation": "test", "timestamp": null}\n'
+        b'{"last_processed_ind'
+    )
+    
+    state = make_processor(FakeCollection(), state_file)._load_state()
+    
+    assert state['last_processed_index'] == 300
+
+
+class RaisingCollection:
+    """Collection dont insert_many lève toujours la même BulkWriteError"""
+    
+    def __init__(self, details):
+        self.details = details
+    
+    def insert_many(self, documents, ordered=True, bypass_document_validation=False):
+        raise BulkWriteError(self.details)
+
+
+def test_write_concern_error_fails_batch(tmp_path):
+    """Une BulkWriteError sans writeErrors mais avec writeConcernErrors est un échec"""
+    collection = RaisingCollection({
+        'nInserted': 0,
+        'writeErrors': [],
+        'writeConcernErrors': [{'code': 64, 'errmsg': 'waiting for replication timed out'}]
+    })
+    processor = make_processor(collection, tmp_path / "batch_state_test.log")
+    
+    assert processor._insert_batch([{'i': 0}], 1) is False
+
+
+def test_duplicate_only_errors_complete_batch(tmp_path):
+    """Un lot dont tous les échecs sont des doublons de clé est complet"""
+    collection = RaisingCollection({
+        'nInserted': 1,
+        'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'E11000 duplicate key'}],
+        'writeConcernErrors': []
+    })
+    processor = make_processor(collection, tmp_path / "batch_state_test.log")
+    
+    assert processor._insert_batch([{'i': 0}, {'i': 1}], 1) is True
+    assert processor.stats['duplicate_items'] == 1
+
+
+def test_partial_insert_with_other_error_fails_batch(tmp_path):
+    """Un insert partiel avec une erreur autre qu'un doublon n'est pas un succès"""
+    collection = RaisingCollection({
+        'nInserted': 1,
+        'writeErrors': [
+            {'index': 1, 'code': 11000, 'errmsg': 'E11000 duplicate key'},
+            {'index': 2, 'code': 121, 'errmsg': 'Document failed validation'}
+        ],
+        'writeConcernErrors': []
+    })
+    processor = make_processor(collection, tmp_path / "batch_state_test.log")
+    
+    assert processor._insert_batch([{'i': 0}, {'i': 1}, {'i': 2}], 1) is False
+
+
+def test_partial_insert_with_write_concern_error_fails_batch(tmp_path):
+    """Un insert partiel non confirmé par le write concern n'est pas un succès"""
+    collection = RaisingCollection({
+        'nInserted': 2,
+        'writeErrors': [],
+        'writeConcernErrors': [{'code': 64, 'errmsg': 'waiting for replication timed out'}]
+    })
+    processor = make_processor(collection, tmp_path / "batch_state_test.log")
+    
+    assert processor._insert_batch([{'i': 0}, {'i': 1}], 1) is False
@@ -0,0 +1,35 @@
+"""
+Tests de la lecture du CSV par morceaux (csv_loader)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_loader
+from csv_loader import iter_healthcare_dataframes
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / 'data.csv'
+    path.write_text('\n'.join(['Name,Age,Billing Amount,Date of Admission', *rows]) + '\n')
+    return str(path)
+
+def test_chunks_span_blocks(tmp_path, monkeypatch):
+    # Blocs de quelques lignes : un morceau regroupe plusieurs blocs
+    monkeypatch.setattr(csv_loader, 'DEFAULT_BLOCK_SIZE', 128)
+    path = write_csv(tmp_path, [f'Name {i},{i},{i}.5,2021-01-01' for i in range(25)])
+    chunks = list(iter_healthcare_dataframes(path, 10))
+    assert [len(df) for df in chunks] == [10, 10, 5]
+    assert chunks[2]['Name'].tolist() == [f'Name {i}' for i in range(20, 25)]
+    assert str(chunks[0]['Age'].dtype) == 'int64'
+    assert str(chunks[0]['Billing Amount'].dtype) == 'float64'
+    # Les dates restent en texte (converties par la migration)
+    assert chunks[0]['Date of Admission'][0] == '2021-01-01'
+
+def test_empty_cells_and_dtype(tmp_path):
+    path = write_csv(tmp_path, ['Alice,30,1.5,2021-01-01', ',,2.5,2021-01-02'])
+    df = next(iter_healthcare_dataframes(path, 10, usecols=['Name', 'Age'], dtype={'Age': 'float32'}))
+    assert list(df.columns) == ['Name', 'Age']
+    assert df.isnull().sum().tolist() == [1, 1]
+    assert str(df['Age'].dtype) == 'float32'
@@ -0,0 +1,45 @@
+"""
+Tests du résumé du CSV calculé par DataIntegrityTester (sans MongoDB)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_data_integrity
+from test_data_integrity import DataIntegrityTester
+
+HEADER = ('Name,Age,Gender,Blood Type,Medical Condition,Date of Admission,Doctor,Hospital,'
+          'Insurance Provider,Billing Amount,Room Number,Admission Type,Discharge Date,'
+          'Medication,Test Results')
+
+def summarize(tmp_path, rows):
+    path = tmp_path / 'healthcare_dataset.csv'
+    path.write_text('\n'.join([HEADER, *rows]) + '\n')
+    tester = DataIntegrityTester()
+    tester.csv_path = str(path)
+    return tester.summarize_csv()
+
+def test_empty_cells_are_missing(tmp_path):
+    summary = summarize(tmp_path, [
+        'Alice,30,Female,A+,Asthma,2021-01-01,Dr A,Hosp A,Aetna,100.5,101,Urgent,2021-01-03,Aspirin,Normal',
+        ',40,Male,B+,Diabetes,2021-02-01,Dr B,Hosp B,Cigna,200.5,102,Elective,2021-02-03,Ibuprofen,Normal',
+        'Carol,50,,O+,Cancer,2021-03-01,Dr C,Hosp C,Medicare,300.5,103,Emergency,2021-03-03,Penicillin,Abnormal',
+    ])
+    assert summary['rows'] == 3
+    assert summary['missing_values'].sum() == 2
+    assert summary['missing_values']['Name'] == 1
+    assert summary['missing_values']['Gender'] == 1
+
+def test_duplicates_across_blocks(tmp_path, monkeypatch):
+    # Blocs de quelques lignes : les doublons sont dans des blocs différents
+    monkeypatch.setattr(test_data_integrity, 'CSV_BLOCK_SIZE', 256)
+    row = 'Name {},{},Male,A+,Asthma,2021-01-01,Dr A,Hosp A,Aetna,100.5,101,Urgent,2021-01-03,Aspirin,Normal'
+    rows = [row.format(i, 20 + i) for i in range(20)]
+    summary = summarize(tmp_path, rows + rows[:3] + [row.format(99, '')])
+    assert summary['rows'] == 24
+    assert summary['duplicates'] == 3
+    assert summary['missing_values']['Age'] == 1
+    assert summary['age_min'] == 20 and summary['age_max'] == 39
+    assert not summary['wrong_types']
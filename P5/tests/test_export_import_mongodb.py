@@ -0,0 +1,30 @@
+"""
+Tests du choix de la compression des exports (sans MongoDB)
+"""
+
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_import_mongodb import compressed_path, dump_stream, open_export_file
+
+def test_extension_mismatch_is_rejected():
+    with pytest.raises(ValueError):
+        compressed_path('export.json.gz', 'none')
+    with pytest.raises(ValueError):
+        compressed_path('export.json.gz', 'zstd')
+    assert compressed_path('export.json', 'gzip') == 'export.json.gz'
+    assert compressed_path('export.json.gz', 'gzip') == 'export.json.gz'
+
+def test_codec_follows_compression_argument(tmp_path):
+    path = str(tmp_path / 'export.json')
+    with open_export_file(path, 'wb', 'gzip') as f:
+        dump_stream([{'name': 'Alice'}], f)
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == b'[\n{"name":"Alice"}\n]\n'
+    with open_export_file(path, 'rb', 'gzip') as f:
+        assert f.read().startswith(b'[')
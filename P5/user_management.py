@@ -3,9 +3,14 @@ Module de gestion des utilisateurs et authentification
 Gère les utilisateurs, rôles et permissions pour MongoDB
 """
 
-from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
+from pymongo import MongoClient, UpdateOne
+from werkzeug.security import check_password_hash
+import atexit
+import hashlib
+import hmac
 import os
+import secrets
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,6 +22,20 @@ MONGO_USERNAME = os.getenv('MONGO_USERNAME', 'admin')
 MONGO_PASSWORD = os.getenv('MONGO_PASSWORD', 'admin123')
 DATABASE_NAME = 'healthcare_db'
 
+# Taille du pool de connexions (couvre les threads d'envoi de BatchProcessor)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+# Connexions gardées ouvertes en permanence dans le pool
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 8))
+# Délais d'ouverture de connexion et de sélection du serveur (ms)
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+# Compression du protocole réseau (zstd via pymongo[zstd], zlib toujours disponible)
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zstd,zlib')
+
+# Hachage des mots de passe (PBKDF2-SHA256 via hashlib/OpenSSL)
+PASSWORD_HASH_METHOD = 'pbkdf2_sha256'
+PASSWORD_HASH_ITERATIONS = 600000
+
 # Définition des rôles et permissions
 ROLES_PERMISSIONS = {
     'admin': ['create', 'read', 'update', 'delete', 'export', 'import', 'manage_users'],
@@ -25,39 +44,100 @@ ROLES_PERMISSIONS = {
     'analyst': ['read', 'export']
 }
 
+# Table figée rôle -> ensemble de permissions, calculée une fois au chargement
+PERMISSIONS_BY_ROLE = MappingProxyType({
+    role: frozenset(permissions) for role, permissions in ROLES_PERMISSIONS.items()
+})
+
+# Client MongoDB partagé par le processus (MongoClient gère lui-même un pool
+# de connexions et peut être utilisé depuis plusieurs threads)
+_CLIENT = None
+
+def get_client():
+    """Retourne le MongoClient partagé, créé à la première utilisation"""
+    global _CLIENT
+    if _CLIENT is None:
+        connection_string = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
+        _CLIENT = MongoClient(connection_string, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                              minPoolSize=MONGO_MIN_POOL_SIZE, maxIdleTimeMS=60000,
+                              connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                              serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                              retryWrites=True, compressors=MONGO_COMPRESSORS,
+                              zlibCompressionLevel=6)
+    return _CLIENT
+
+def close_client():
+    """Ferme le MongoClient partagé (appelée automatiquement en fin de processus)"""
+    global _CLIENT
+    if _CLIENT is not None:
+        _CLIENT.close()
+        _CLIENT = None
+
+# Les scripts ne ferment plus le client eux-mêmes : le pool reste disponible
+# pour les opérations suivantes du même processus
+atexit.register(close_client)
+
 class UserManager:
     """Gestionnaire d'utilisateurs pour MongoDB"""
     
+    # Les index ne sont créés qu'une fois par processus
+    _indexes_created = False
+    
     def __init__(self):
-        """Initialise la connexion MongoDB"""
-        connection_string = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
-        self.client = MongoClient(connection_string)
+        """Initialise la connexion MongoDB (client partagé)"""
+        self.client = get_client()
         self.db = self.client[DATABASE_NAME]
         self.users_collection = self.db['users']
         self.roles_collection = self.db['roles']
+        self._ensure_indexes()
+    
+    def _ensure_indexes(self):
+        """Crée les index de recherche par nom (opération idempotente)"""
+        if UserManager._indexes_created:
+            return
+        # L'index sur username sert aussi la recherche {'username', 'active'}
+        self.users_collection.create_index([('username', 1)], unique=True)
+        self.roles_collection.create_index([('name', 1)], unique=True)
+        UserManager._indexes_created = True
     
     def hash_password(self, password):
-        """Hash un mot de passe avec salt"""
-        return generate_password_hash(password)
+        """Hash un mot de passe avec salt (format: pbkdf2_sha256$iterations$salt$hash)"""
+        salt = secrets.token_hex(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'),
+                                     PASSWORD_HASH_ITERATIONS)
+        return f"{PASSWORD_HASH_METHOD}${PASSWORD_HASH_ITERATIONS}${salt}${digest.hex()}"
     
     def verify_password(self, password_hash, password):
-        """Vérifie un mot de passe"""
-        return check_password_hash(password_hash, password)
+        """Vérifie un mot de passe (les anciens hash Werkzeug restent acceptés)"""
+        if not password_hash.startswith(f"{PASSWORD_HASH_METHOD}$"):
+            return check_password_hash(password_hash, password)
+        
+        try:
+            _, iterations, salt, expected = password_hash.split('$')
+            iterations = int(iterations)
+        except ValueError:
+            return False
+        
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'),
+                                     iterations)
+        return hmac.compare_digest(digest.hex(), expected)
     
     def initialize_roles(self):
         """Initialise les rôles dans la base de données"""
-        for role_name, permissions in ROLES_PERMISSIONS.items():
-            role_doc = {
-                'name': role_name,
-                'permissions': permissions
-            }
-            # Vérifier si le rôle existe déjà
-            if not self.roles_collection.find_one({'name': role_name}):
-                self.roles_collection.insert_one(role_doc)
+        # Un seul aller-retour : les rôles existants ne sont pas modifiés
+        operations = [
+            UpdateOne(
+                {'name': role_name},
+                {'$setOnInsert': {'name': role_name, 'permissions': permissions}},
+                upsert=True
+            )
+            for role_name, permissions in ROLES_PERMISSIONS.items()
+        ]
+        self.roles_collection.bulk_write(operations, ordered=False)
     
     def create_user(self, username, password, role):
         """Crée un nouvel utilisateur"""
-        if role not in ROLES_PERMISSIONS:
+        if role not in PERMISSIONS_BY_ROLE:
             raise ValueError(f"Rôle invalide: {role}")
         
         # Vérifier si l'utilisateur existe déjà
@@ -84,16 +164,17 @@ class UserManager:
         if not self.verify_password(user['password_hash'], password):
             raise ValueError("Nom d'utilisateur ou mot de passe incorrect")
         
-        # Retourner les informations de l'utilisateur (sans le hash)
+        # Retourner les informations de l'utilisateur (sans le hash),
+        # permissions en frozenset pour des vérifications en O(1)
         return {
             'username': user['username'],
             'role': user['role'],
-            'permissions': ROLES_PERMISSIONS.get(user['role'], [])
+            'permissions': PERMISSIONS_BY_ROLE.get(user['role'], frozenset())
         }
     
     def check_permission(self, user_info, permission):
         """Vérifie si l'utilisateur a une permission"""
-        return permission in user_info.get('permissions', [])
+        return permission in user_info.get('permissions', ())
     
     def list_users(self):
         """Liste tous les utilisateurs"""
@@ -101,7 +182,7 @@ class UserManager:
     
     def update_user_role(self, username, new_role):
         """Met à jour le rôle d'un utilisateur"""
-        if new_role not in ROLES_PERMISSIONS:
+        if new_role not in PERMISSIONS_BY_ROLE:
             raise ValueError(f"Rôle invalide: {new_role}")
         
         result = self.users_collection.update_one(
@@ -130,5 +211,5 @@ class UserManager:
             raise ValueError(f"Utilisateur '{username}' non trouvé")
     
     def close(self):
-        """Ferme la connexion MongoDB"""
-        self.client.close()
+        """Ne fait rien : le client est partagé, voir close_client()"""
+        pass